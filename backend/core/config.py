@@ -10,5 +10,15 @@ class Config:
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", 1888))
     DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+    # Kernel interfaces read by the pressure collector; point at a fixture tree for tests
+    PROC_ROOT = os.getenv("PROC_ROOT", "/proc")
+    CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+    # sysfs read by the CPU temperature / RAPL power sensors; likewise overridable
+    SYSFS_ROOT = os.getenv("SYSFS_ROOT", "/sys")
+    METRICS_DIR = os.getenv("METRICS_DIR", "/home/vaio/vaio-board/workspace/metrics")
+    # Optional durable copy of metrics history in the database
+    METRICS_DB_SINK = os.getenv("METRICS_DB_SINK", "false").lower() == "true"
+    METRICS_DB_FLUSH_SECONDS = float(os.getenv("METRICS_DB_FLUSH_SECONDS", 10))
+    METRICS_DB_RETENTION_DAYS = int(os.getenv("METRICS_DB_RETENTION_DAYS", 30))
 
 config = Config()
@@ -15,7 +15,10 @@ from backend.db.init import init_db
 from backend.db.models import Service
 from backend.db.session import engine
 from backend.sockets.router import register_sio_handlers
-from backend.services.env.metrics_history import reset_all_history, start_periodic_reset
+from backend.services.env.metrics_history import attach_history, flush_all_history
+from backend.services.env.host_inventory import refresh_host_inventory
+from backend.services.env.metric_sink import start_metric_sink, stop_metric_sink
+from backend.sockets.env.metric_hub import get_metric_hub
 
 logger = logging.getLogger(__name__)
 logger.info("Starting vAio Backend server")
@@ -50,9 +53,18 @@ async def lifespan(app: FastAPI):
         for svc in session.exec(select(Service)).all():
             svc.status = "OFFLINE"
         session.commit()
-    reset_all_history()
-    start_periodic_reset()
+    refresh_host_inventory()
+    # Reopen persisted history instead of starting empty after a restart
+    attach_history(config.METRICS_DIR)
+    if config.METRICS_DB_SINK:
+        start_metric_sink(engine, config.METRICS_DB_FLUSH_SECONDS, config.METRICS_DB_RETENTION_DAYS)
+    # Record history whether or not a dashboard is connected
+    get_metric_hub().start_recording()
     yield
+    # Shutdown
+    get_metric_hub().stop()
+    flush_all_history()
+    stop_metric_sink()
 
 # ============================================
 # ROUTE REGISTRATION - SINGLE POINT OF TRUTH
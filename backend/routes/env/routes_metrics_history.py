@@ -1,18 +1,131 @@
-from fastapi import APIRouter, Query
-from backend.services.env.metrics_history import get_metric_history
+import gzip
+import json
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from backend.services.env.downsample import METHOD_LTTB, METHODS
+from backend.services.env.metric_sketch import RELATIVE_ACCURACY
+from backend.services.env.metrics_history import (
+    DEFAULT_POINTS,
+    query_metric_batch,
+    query_metric_history,
+    query_metric_quantiles
+)
 
 router = APIRouter(prefix="/api/history", tags=["Metrics"])
 
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+def _parse_series(series: List[str]) -> Dict[str, Optional[List[str]]]:
+    """"cpu:cpu_usage,cpu_cores" / "memory" entries -> {type: fields or None for all}"""
+    parsed: Dict[str, Optional[List[str]]] = {}
+    for entry in series:
+        metric_type, _, fields = entry.partition(":")
+        names = [name for name in fields.split(",") if name] if fields else None
+        if not metric_type:
+            raise HTTPException(status_code=400, detail=f"Invalid series {entry!r}")
+        if names is None or (metric_type in parsed and parsed[metric_type] is None):
+            parsed[metric_type] = None
+        else:
+            parsed[metric_type] = parsed.get(metric_type, []) + names
+    return parsed
+
+
+@router.get("/batch")
+def get_metrics_history_batch(
+    request: Request,
+    series: List[str] = Query(..., min_length=1),
+    minutes: int = Query(10, ge=1),
+    bucket: Optional[float] = Query(None, gt=0)
+):
+    """Several metric types in one response on a shared time axis
+
+    Each `series` is "<type>" (every field) or "<type>:<field>,<field>" and
+    may be repeated. The window is cut into `bucket`-second buckets aligned
+    to multiples of the bucket size; bucket i starts at start + i * bucket
+    and every column holds one mean (or null) per bucket:
+
+        {"start", "bucket", "count", "resolution": {type: seconds},
+         "columns": {"cpu:cpu_usage": [...], "memory:memory_percent": [...]}}
+
+    The body is serialised once and gzip-compressed for clients that accept it.
+    """
+    data = query_metric_batch(_parse_series(series), minutes * 60, bucket)
+    body = json.dumps(data, separators=(",", ":")).encode()
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _parse_quantiles(q: str) -> List[float]:
+    try:
+        qs = [float(part) for part in q.split(",") if part.strip()]
+    except ValueError:
+        qs = []
+    if not qs or any(not 0 <= value <= 1 for value in qs):
+        raise HTTPException(status_code=400, detail="q must be a comma-separated list of quantiles in [0, 1]")
+    return qs
+
+
+@router.get("/{metric_type}/quantiles")
+async def get_metrics_quantiles(
+    metric_type: str,
+    q: str = Query("0.5,0.95,0.99"),
+    minutes: int = Query(60, ge=1),
+    field: Optional[str] = Query(None)
+):
+    """Percentiles of each numeric field of a metric type over the last `minutes`
+
+    Windows within the raw history (an hour) are exact; longer windows merge
+    per-bucket quantile sketches, with values within `accuracy` (relative) of
+    the true quantile, in constant memory whatever the window length.
+    """
+    qs = _parse_quantiles(q)
+    resolution, fields = query_metric_quantiles(metric_type, minutes * 60, qs, field)
+    return {
+        "metric_type": metric_type,
+        "minutes": minutes,
+        "resolution": resolution,
+        "accuracy": 0 if not resolution else RELATIVE_ACCURACY,
+        "fields": fields
+    }
+
+
 @router.get("/{metric_type}")
-async def get_metrics_history(metric_type: str, minutes: int = Query(10)):
-    """Get historical metrics data for the specified metric type and time window"""
-    import time
-    
-    # Get the raw history
-    history_data = get_metric_history(metric_type)
-    
-    # Filter by time window
-    cutoff_time = time.time() - (minutes * 60)
-    filtered_data = [entry for entry in history_data if entry["timestamp"] >= cutoff_time]
-        
-    return filtered_data
+async def get_metrics_history(
+    metric_type: str,
+    response: Response,
+    minutes: int = Query(10, ge=1),
+    points: int = Query(DEFAULT_POINTS, ge=1),
+    downsample: str = Query(METHOD_LTTB),
+    field: Optional[str] = Query(None),
+    since: Optional[float] = Query(None),
+    cursor: Optional[str] = Query(None)
+):
+    """Get historical metrics data for the specified metric type and time window
+
+    Short windows return raw samples; longer ones are served from a rollup
+    tier whose rows carry per-bucket min/max/last values. Windows with more
+    than `points` rows are downsampled on the server ("lttb" or "minmax"),
+    driven by `field` or the type's primary series. The resolution of the
+    source data is in X-History-Resolution.
+
+    For incremental polling pass `since` (a timestamp) or the opaque
+    X-History-Cursor value from the previous response as `cursor`; only
+    newer points are returned (rollup levels also repeat the open bucket).
+    """
+    if downsample not in METHODS:
+        raise HTTPException(status_code=400, detail=f"downsample must be one of {', '.join(METHODS)}")
+    try:
+        resolution, rows, next_cursor = query_metric_history(
+            metric_type, minutes * 60, points, field, downsample, since, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if resolution is not None:
+        response.headers["X-History-Resolution"] = str(resolution)
+        response.headers["X-History-Cursor"] = next_cursor
+    return rows
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Request, Response
+from backend.sockets.env.openmetrics import (
+    OPENMETRICS_CONTENT_TYPE,
+    TEXT_CONTENT_TYPE,
+    get_metrics_exposition
+)
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics")
+def get_metrics(request: Request):
+    """Prometheus scrape endpoint
+
+    Serves OpenMetrics to scrapers that accept it and the Prometheus 0.0.4
+    text format otherwise. The body is cached between collector samples.
+    """
+    openmetrics = "application/openmetrics-text" in request.headers.get("accept", "")
+    body = get_metrics_exposition().body(openmetrics)
+    return Response(content=body, media_type=OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE)
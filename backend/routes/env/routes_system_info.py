@@ -1,90 +1,38 @@
 from fastapi import APIRouter
 import psutil
-import platform
 import time
-import subprocess
 from datetime import datetime
-import re
+from backend.services.env.host_inventory import get_host_inventory, refresh_host_inventory
+from backend.services.env.nvml_session import get_nvml_session
 
 router = APIRouter()
 
-def run_nvidia_smi(args=None):
-    """Run nvidia-smi command with given arguments and return the output"""
-    cmd = ["nvidia-smi"]
-    if args:
-        cmd.extend(args)
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            return None
-        return result.stdout
-    except (subprocess.TimeoutExpired, FileNotFoundError):
+def get_gpu_info(inventory):
+    """First GPU's details from the inventory and the shared NVML session"""
+    devices = get_nvml_session().sample()
+    if not devices:
         return None
 
-def parse_gpu_info(output):
-    """Parse nvidia-smi output and return GPU information as JSON"""
-    if not output:
-        return None
-        
-    # Extract basic information using regex patterns
-    gpu_info = {}
-    
-    # Get GPU name
-    name_match = re.search(r"(?:NVIDIA\s*)(.*?)(?:\s*\(UUID:|$)", output)
-    if name_match:
-        gpu_info["name"] = name_match.group(1).strip()
-    else:
-        gpu_info["name"] = "Unknown NVIDIA GPU"
-    
-    # Get driver version
-    driver_match = re.search(r"Driver Version: (\S+)", output)
-    if driver_match:
-        gpu_info["driver"] = driver_match.group(1)
-    
-    # Get memory usage
-    memory_match = re.search(r"(\d+)MiB\s*/\s*(\d+)MiB", output)
-    if memory_match:
-        used = int(memory_match.group(1))
-        total = int(memory_match.group(2))
-        gpu_info["memory"] = {
-            "used": used,
-            "total": total,
-            "free": total - used,
-            "unit": "MiB"
-        }
-    
-    # Get utilization
-    util_match = re.search(r"Gpu\s*:\s*(\d+)\s*%", output)
-    if util_match:
-        gpu_info["utilization"] = int(util_match.group(1))
-    
-    # Get temperature
-    temp_match = re.search(r"(\d+)C", output)
-    if temp_match:
-        gpu_info["temperature"] = int(temp_match.group(1))
-    
+    first = devices[0]
+    gpu_info = {"name": first["name"] or "Unknown NVIDIA GPU"}
+    if inventory.get("gpu_driver"):
+        gpu_info["driver"] = inventory["gpu_driver"]
+    gpu_info["memory"] = {
+        "used": first["gpu_mem_used"],
+        "total": first["gpu_mem_total"],
+        "free": first["gpu_mem_total"] - first["gpu_mem_used"],
+        "unit": "MiB"
+    }
+    gpu_info["utilization"] = first["gpu_usage"]
+    gpu_info["temperature"] = first["gpu_temp"]
     return gpu_info
 
 @router.get("/info")
 def get_system_info():
     """Get full system information: CPU, memory, disk, OS."""
     try:
-        # CPU information
-        cpu_count = psutil.cpu_count(logical=False)
-        cpu_count_logical = psutil.cpu_count(logical=True)
-
-        # CPU model
-        cpu_model = "Unknown CPU"
-        try:
-            with open("/proc/cpuinfo", "r") as f:
-                for line in f:
-                    if "model name" in line:
-                        # More accurate regex that handles both "model name:" and "model name\t:" formats
-                        cpu_model = re.sub(r"model name\s*:\s*", "", line.strip())
-                        break
-        except Exception as e:
-            print(f"Error reading CPU model: {e}")
+        # Static host facts (CPU model, cores, OS, arch) come from the inventory cache
+        inventory = get_host_inventory()
 
         # Memory information
         memory = psutil.virtual_memory()
@@ -94,40 +42,25 @@ def get_system_info():
         disk = psutil.disk_usage('/')
 
         # Boot time
-        boot_time = datetime.fromtimestamp(psutil.boot_time()).isoformat()
-
-        # OS information
-        os_info = None
-        try:
-            with open("/etc/os-release", "r") as f:
-                for line in f:
-                    if line.startswith("PRETTY_NAME="):
-                        os_info = line.split("=")[1].strip().strip('"')
-                        break
-        except Exception as e:
-            print(f"Error reading OS info: {e}")
-            os_info = platform.platform()
-
-        # Architecture
-        arch = platform.machine()
+        boot_time = datetime.fromtimestamp(inventory["boot_time"]).isoformat()
 
         # Uptime
-        uptime_seconds = int(time.time() - psutil.boot_time())
+        uptime_seconds = int(time.time() - inventory["boot_time"])
 
         # GPU information
-        gpu_info = parse_gpu_info(run_nvidia_smi())
+        gpu_info = get_gpu_info(inventory)
 
         return {
             "version": 1,
             "data": {
                 "cpu": {
-                    "physical_cores": cpu_count,
-                    "logical_cores": cpu_count_logical,
-                    "model": cpu_model,
-                    "architecture": arch
+                    "physical_cores": inventory["physical_cores"],
+                    "logical_cores": inventory["logical_cores"],
+                    "model": inventory["cpu_model"],
+                    "architecture": inventory["architecture"]
                 },
                 "os": {
-                    "name": os_info,
+                    "name": inventory["os_name"],
                     "uptime_seconds": uptime_seconds
                 },
                 "memory": {
@@ -143,19 +76,27 @@ def get_system_info():
                     "percent": disk.percent
                 },
                 "boot_time": boot_time,
-                "gpu": gpu_info
+                "gpu": gpu_info,
+                "gpu_names": inventory["gpu_names"]
             }
         }
     except Exception as e:
         return {"version": 1, "error": str(e)}
 
+@router.post("/info/refresh")
+def refresh_system_info():
+    """Re-read static host facts after a hardware or OS change"""
+    try:
+        return {"version": 1, "data": refresh_host_inventory()}
+    except Exception as e:
+        return {"version": 1, "error": str(e)}
+
 @router.get("/nvidia/info")
 def get_nvidia_info():
     """Get NVIDIA GPU information - compatibility endpoint"""
     try:
-        output = run_nvidia_smi()
-        if output:
-            gpu_info = parse_gpu_info(output)
+        gpu_info = get_gpu_info(get_host_inventory())
+        if gpu_info:
             return {
                 "available": True,
                 "info": gpu_info,
@@ -164,7 +105,7 @@ def get_nvidia_info():
         else:
             return {
                 "available": False,
-                "error": "NVIDIA GPU not available or nvidia-smi failed",
+                "error": "NVIDIA GPU not available or NVML failed",
                 "timestamp": datetime.now().isoformat()
             }
     except Exception as e:
@@ -178,6 +119,8 @@ def get_nvidia_info():
 def get_simplified_system_info():
     """Get simplified system information including CPU details (for backward compatibility)"""
     try:
+        inventory = get_host_inventory()
+
         # Use the main system info function but reformat the output
         full_info = get_system_info()
         
@@ -190,11 +133,11 @@ def get_simplified_system_info():
         # Format in the legacy structure 
         return {
             "system": {
-                "hostname": platform.node(),
-                "platform": platform.system(),
-                "release": platform.release(),
-                "version": platform.version(),
-                "machine": platform.machine(),
+                "hostname": inventory["hostname"],
+                "platform": inventory["platform"],
+                "release": inventory["release"],
+                "version": inventory["version"],
+                "machine": inventory["architecture"],
                 "cpu": {
                     "model": data.get("cpu", {}).get("model", "Unknown CPU"),
                     "physical_cores": data.get("cpu", {}).get("physical_cores", 0),
@@ -19,6 +19,7 @@ from backend.routes.user.routes_api_users import router as api_users_router
 from backend.routes.layout.pane_layout import router as pane_layout_router
 from backend.routes.layout.routes_session import router as session_router
 from backend.routes.env.routes_metrics_history import router as metrics_history_router
+from backend.routes.env.routes_openmetrics import router as openmetrics_router
 from backend.routes.env.routes_system_info import router as system_info_router
 from backend.routes.env.routes_ml_environment import router as ml_environment_router
 from backend.routes.env.routes_commands import router as commands_router
@@ -62,6 +63,8 @@ router.include_router(session_router, tags=["User Sessions"])
 # ===== ENVIRONMENT & METRICS =====
 # metrics_history_router already has prefix="/api/history"
 router.include_router(metrics_history_router, tags=["Metrics History"])
+# Prometheus scrape endpoint lives at /metrics
+router.include_router(openmetrics_router, tags=["Metrics"])
 router.include_router(system_info_router, prefix="/api/system", tags=["System Info"])
 router.include_router(ml_environment_router, prefix="/api", tags=["ML Environment"])
 
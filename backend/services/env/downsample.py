@@ -0,0 +1,77 @@
+"""Point-count reduction for history responses.
+
+Both methods return the *indices* of the samples to keep, chosen from one
+driver series, so every other field of the selected rows stays aligned on
+the same timestamps:
+
+- lttb: Largest-Triangle-Three-Buckets keeps the visual shape of a line.
+- minmax: each bucket keeps its lowest and highest sample, so spikes and
+  dips survive at the cost of returning up to `threshold` points.
+"""
+import numpy as np
+
+METHOD_LTTB = "lttb"
+METHOD_MINMAX = "minmax"
+METHODS = (METHOD_LTTB, METHOD_MINMAX)
+
+
+def _evenly_spaced(n: int, threshold: int) -> np.ndarray:
+    return np.unique(np.linspace(0, n - 1, max(threshold, 1)).round().astype(np.int64))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of at most `threshold` points chosen by LTTB"""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return _evenly_spaced(n, threshold)
+
+    y = np.nan_to_num(y)
+    # threshold - 2 buckets over the interior points; first and last are kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+    avg_x = np.add.reduceat(x[:n - 1], starts) / sizes
+    avg_y = np.add.reduceat(y[:n - 1], starts) / sizes
+    # The point after the last bucket is the final sample
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = starts[i], ends[i]
+        # Twice the triangle area, vectorised over the bucket
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of each bucket's minimum and maximum, at most `threshold` points"""
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 2:
+        return _evenly_spaced(n, threshold)  # No room for a min/max pair
+    buckets = threshold // 2
+    size = -(-n // buckets)
+    pad = buckets * size - n
+    missing = np.isnan(y)
+    low = np.pad(np.where(missing, np.inf, y), (0, pad), constant_values=np.inf).reshape(buckets, size)
+    high = np.pad(np.where(missing, -np.inf, y), (0, pad), constant_values=-np.inf).reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate((offsets + low.argmin(axis=1), offsets + high.argmax(axis=1)))
+    return np.unique(indices[indices < n])
+
+
+def downsample_indices(timestamps: np.ndarray, values: np.ndarray, threshold: int,
+                       method: str = METHOD_LTTB) -> np.ndarray:
+    """Indices to keep so a series fits in `threshold` points"""
+    if method == METHOD_MINMAX:
+        return minmax_indices(values, threshold)
+    return lttb_indices(timestamps, values, threshold)
@@ -0,0 +1,99 @@
+"""Static host facts shared by the metric streams and system-info routes.
+
+CPU model, core counts, total memory, OS, architecture, GPU names and the GPU
+driver version do not change while the backend runs, so they are computed
+once at startup and only recomputed when refresh_host_inventory() is called
+explicitly. Readers get the cached dict and never touch /proc or /etc on the
+hot path.
+"""
+import logging
+import platform
+import re
+import threading
+from typing import Any, Dict, Optional
+
+import psutil
+
+from backend.services.env.nvml_session import get_nvml_session
+
+logger = logging.getLogger(__name__)
+
+CPUINFO_PATH = "/proc/cpuinfo"
+OS_RELEASE_PATH = "/etc/os-release"
+
+_inventory: Optional[Dict[str, Any]] = None
+_inventory_lock = threading.Lock()
+
+
+def _read_cpu_model() -> str:
+    try:
+        with open(CPUINFO_PATH, "r") as f:
+            for line in f:
+                if "model name" in line:
+                    # Handles both "model name:" and "model name\t:" formats
+                    return re.sub(r"model name\s*:\s*", "", line.strip())
+    except Exception as e:
+        logger.warning(f"Error reading CPU model: {e}")
+    return platform.processor() or "Unknown CPU"
+
+
+def _read_os_name() -> str:
+    try:
+        with open(OS_RELEASE_PATH, "r") as f:
+            for line in f:
+                if line.startswith("PRETTY_NAME="):
+                    return line.split("=", 1)[1].strip().strip('"')
+    except Exception as e:
+        logger.warning(f"Error reading OS info: {e}")
+    return platform.platform()
+
+
+def _collect_inventory() -> Dict[str, Any]:
+    memory = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+    uname = platform.uname()
+
+    try:
+        session = get_nvml_session()
+        gpu_names = session.device_names()
+        gpu_driver = session.driver_version()
+    except Exception as e:
+        logger.warning(f"Error reading GPU names: {e}")
+        gpu_names = []
+        gpu_driver = None
+
+    return {
+        "hostname": uname.node,
+        "platform": uname.system,
+        "release": uname.release,
+        "version": uname.version,
+        "architecture": uname.machine,
+        "os_name": _read_os_name(),
+        "cpu_model": _read_cpu_model(),
+        "physical_cores": psutil.cpu_count(logical=False) or 0,
+        "logical_cores": psutil.cpu_count(logical=True) or 0,
+        "memory_total": memory.total,
+        "swap_total": swap.total,
+        "boot_time": psutil.boot_time(),
+        "gpu_names": gpu_names,
+        "gpu_driver": gpu_driver,
+    }
+
+
+def refresh_host_inventory() -> Dict[str, Any]:
+    """Recompute the inventory, e.g. at startup or after hardware changes"""
+    global _inventory
+    inventory = _collect_inventory()
+    with _inventory_lock:
+        _inventory = inventory
+    logger.info(f"Host inventory refreshed: {inventory['cpu_model']}, "
+                f"{inventory['logical_cores']} logical cores, {len(inventory['gpu_names'])} GPU(s)")
+    return inventory
+
+
+def get_host_inventory() -> Dict[str, Any]:
+    """Return the cached inventory, computing it on first use"""
+    inventory = _inventory
+    if inventory is None:
+        inventory = refresh_host_inventory()
+    return inventory
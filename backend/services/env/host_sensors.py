@@ -0,0 +1,192 @@
+"""CPU package temperature and RAPL power from sysfs, with cached file handles.
+
+psutil.sensors_temperatures() walks and re-opens every hwmon file on each
+call. Sensors do not come and go while the backend runs, so discovery walks
+sysfs once and keeps a read-only descriptor per chosen attribute; every tick
+then costs one os.pread() per file:
+
+- temperature: hwmon package sensors (coretemp "Package id N", k10temp /
+  zenpower "Tctl"/"Tdie", ARM cpu_thermal), falling back to thermal zones of
+  CPU types. The hottest package is reported.
+- power: top-level /sys/class/powercap RAPL package domains; watts are the
+  energy_uj delta over the interval, corrected for counter wrap (a sample
+  that wraps without a readable max_energy_range_uj is dropped). energy_uj
+  is root-only on many kernels; unreadable domains are skipped.
+
+If a read fails (driver reloaded, device gone) every handle is closed and
+discovery runs again after REDISCOVER_SECONDS. The sysfs root is
+config.SYSFS_ROOT so tests can point it at a fixture tree.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.core.config import config
+
+logger = logging.getLogger(__name__)
+
+# hwmon chips whose labelled inputs describe the CPU package
+CPU_HWMON_CHIPS = ("coretemp", "k10temp", "zenpower", "cpu_thermal", "soc_thermal")
+PACKAGE_LABELS = ("package id", "tctl", "tdie")
+
+# Thermal zone types used when no hwmon chip matched
+CPU_THERMAL_TYPES = ("x86_pkg_temp", "cpu-thermal", "cpu_thermal", "soc_thermal", "soc-thermal")
+
+# Seconds before retrying discovery after a failed read
+REDISCOVER_SECONDS = 60
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _pread_int(fd: int) -> int:
+    return int(os.pread(fd, 32, 0))
+
+
+class HostSensors:
+    """Open handles on the CPU temperature and RAPL energy files"""
+
+    def __init__(self, sysfs_root: Optional[str] = None):
+        self.root = sysfs_root or config.SYSFS_ROOT
+        self._lock = threading.Lock()
+        self._temperatures: List[int] = []
+        # (fd, wrap range in uJ) per RAPL package domain
+        self._energy: List[Tuple[int, int]] = []
+        self._last_energy: Optional[Tuple[float, List[int]]] = None
+        self._discovered = False
+        self._retry_at = 0.0
+
+    # --- discovery -----------------------------------------------------
+
+    def _open(self, path: str) -> Optional[int]:
+        fd = None
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            os.pread(fd, 32, 0)  # Readable, not just openable (energy_uj may be root-only)
+            return fd
+        except OSError:
+            if fd is not None:
+                os.close(fd)
+            return None
+
+    def _hwmon_paths(self) -> List[str]:
+        paths = []
+        for hwmon in sorted(glob.glob(os.path.join(self.root, "class", "hwmon", "hwmon*"))):
+            if _read_text(os.path.join(hwmon, "name")) not in CPU_HWMON_CHIPS:
+                continue
+            inputs = sorted(glob.glob(os.path.join(hwmon, "temp*_input")))
+            labelled = [path for path in inputs
+                        if (_read_text(path.replace("_input", "_label")) or "").lower().startswith(PACKAGE_LABELS)]
+            # Chips without package labels (e.g. cpu_thermal) expose a single CPU sensor
+            paths += labelled or inputs[:1]
+        return paths
+
+    def _thermal_paths(self) -> List[str]:
+        return [os.path.join(zone, "temp")
+                for zone in sorted(glob.glob(os.path.join(self.root, "class", "thermal", "thermal_zone*")))
+                if _read_text(os.path.join(zone, "type")) in CPU_THERMAL_TYPES]
+
+    def _rapl_domains(self) -> List[str]:
+        domains = []
+        for domain in sorted(glob.glob(os.path.join(self.root, "class", "powercap", "*rapl*"))):
+            # Top-level domains ("intel-rapl:0") are packages; "intel-rapl:0:1" are subzones
+            if domain.rsplit("/", 1)[-1].count(":") != 1:
+                continue
+            if (_read_text(os.path.join(domain, "name")) or "").startswith("package"):
+                domains.append(domain)
+        return domains
+
+    def _discover(self) -> None:
+        self._close()
+        for path in self._hwmon_paths() or self._thermal_paths():
+            fd = self._open(path)
+            if fd is not None:
+                self._temperatures.append(fd)
+        for domain in self._rapl_domains():
+            fd = self._open(os.path.join(domain, "energy_uj"))
+            if fd is None:
+                logger.info(f"RAPL energy counter in {domain} is not readable; power not reported for it")
+                continue
+            wrap = _read_text(os.path.join(domain, "max_energy_range_uj"))
+            self._energy.append((fd, int(wrap) if wrap and wrap.isdigit() else 0))
+        self._discovered = True
+        logger.info(f"Host sensors: {len(self._temperatures)} CPU temperature inputs, "
+                    f"{len(self._energy)} RAPL package domains")
+
+    def _close(self) -> None:
+        for fd in self._temperatures + [fd for fd, _ in self._energy]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._temperatures = []
+        self._energy = []
+        self._last_energy = None
+        self._discovered = False
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    # --- sampling ------------------------------------------------------
+
+    def _power(self, now: float) -> Optional[float]:
+        energy = [_pread_int(fd) for fd, _ in self._energy]
+        previous, self._last_energy = self._last_energy, (now, energy)
+        if previous is None or now <= previous[0]:
+            return None
+        watts = 0.0
+        for (_, wrap), before, after in zip(self._energy, previous[1], energy):
+            delta = after - before
+            if delta < 0:
+                if not wrap:
+                    return None  # Wrapped, but the range is unknown
+                delta += wrap  # Counter wrapped
+            watts += delta / 1e6 / (now - previous[0])
+        return round(watts, 1)
+
+    def read(self) -> Dict[str, Any]:
+        """{"cpu_temperature": °C, "cpu_power_watts": W}, omitting what the host lacks"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._discovered:
+                if now < self._retry_at:
+                    return {}
+                self._discover()
+
+            readings = {}
+            try:
+                if self._temperatures:
+                    # millidegrees Celsius
+                    readings["cpu_temperature"] = max(_pread_int(fd) for fd in self._temperatures) / 1000.0
+                if self._energy:
+                    watts = self._power(now)
+                    if watts is not None:
+                        readings["cpu_power_watts"] = watts
+            except (OSError, ValueError) as e:
+                logger.warning(f"Host sensor read failed, rediscovering in {REDISCOVER_SECONDS}s: {e}")
+                self._close()
+                self._retry_at = now + REDISCOVER_SECONDS
+                return {}
+            return readings
+
+
+_sensors: Optional[HostSensors] = None
+_sensors_lock = threading.Lock()
+
+
+def get_host_sensors() -> HostSensors:
+    """Return the process-wide sensor handles, discovered on first read"""
+    global _sensors
+    with _sensors_lock:
+        if _sensors is None:
+            _sensors = HostSensors()
+        return _sensors
@@ -0,0 +1,293 @@
+"""Columnar ring buffer for one metric type's history.
+
+Each numeric field lives in its own preallocated float64 array next to a
+shared timestamp array; a single append counter gives head and size, so
+appends are O(1) with no per-sample allocation. A point costs 8 bytes per
+field instead of a pair of Python dicts, so hours of 1s history fit in a few
+MB. Timestamps are kept sorted, so window queries binary-search their bounds
+and copy only the selected slice; rows are only materialised as dicts when a
+response is built. Every sample also has a sequence number (its append
+count), which lets pollers ask for exactly the samples they have not seen.
+
+Non-numeric values (CPU model, GPU name, interface name, ...) do not vary
+per sample in practice and are kept as the latest value per field. Fields
+that appear later are back-filled with NaN, which reads back as "absent".
+
+A ring opened with a directory keeps every array in a fixed-size
+memory-mapped file there (one file per column), so history survives a
+restart or crash of the backend. Appends are plain stores into the mapping
+and the append counter is written last, which makes it the commit point: a
+crash mid-append loses at most that sample. The field layout and static
+values live in meta.json and are only rewritten when they change.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+COUNT_FILE = "count.i64"
+TIMESTAMP_FILE = "timestamps.f64"
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _field_key(field: Any) -> Hashable:
+    # JSON turns tuple field keys (used by rollups) into lists
+    return tuple(field) if isinstance(field, list) else field
+
+
+class MetricRing:
+    """Fixed-capacity, column-oriented store of (timestamp, fields) samples"""
+
+    __slots__ = ("capacity", "path", "timestamps", "columns", "files", "integer", "static",
+                 "_count", "_lock")
+
+    def __init__(self, capacity: int, path: Optional[str] = None):
+        self.capacity = capacity
+        self.path = path
+        self.columns: Dict[Hashable, np.ndarray] = {}
+        # Column file names for file-backed rings
+        self.files: Dict[Hashable, str] = {}
+        # Fields first seen as ints are returned as ints
+        self.integer: Dict[Hashable, bool] = {}
+        self.static: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        if path is None:
+            self._count = np.zeros(1, dtype=np.int64)
+            self.timestamps = np.zeros(capacity, dtype=np.float64)
+        else:
+            self._open()
+
+    # --- storage -------------------------------------------------------
+
+    def _allocate(self, name: str, dtype, length: int) -> np.ndarray:
+        """Zeroed array, memory-mapped from `name` for file-backed rings
+
+        Zeroed allocations and freshly created files are both lazy, so long,
+        mostly empty rings stay cheap.
+        """
+        if self.path is None:
+            return np.zeros(length, dtype=dtype)
+        filename = os.path.join(self.path, name)
+        expected = length * np.dtype(dtype).itemsize
+        exists = os.path.exists(filename) and os.path.getsize(filename) == expected
+        return np.memmap(filename, dtype=dtype, mode="r+" if exists else "w+", shape=(length,))
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.path, META_FILE), "r") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable metrics history in {self.path}: {e}")
+            return None
+        if meta.get("version") != FORMAT_VERSION or meta.get("capacity") != self.capacity:
+            logger.info(f"Metrics history layout in {self.path} changed, starting fresh")
+            return None
+        return meta
+
+    def _save_meta(self) -> None:
+        if self.path is None:
+            return
+        meta = {
+            "version": FORMAT_VERSION,
+            "capacity": self.capacity,
+            "fields": [[field, self.files[field], self.integer[field]] for field in self.columns],
+            "static": self.static
+        }
+        # Write-then-rename so a crash never leaves a half-written layout
+        filename = os.path.join(self.path, META_FILE)
+        with open(filename + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(filename + ".tmp", filename)
+
+    def _open(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        meta = self._read_meta()
+        if meta is None:
+            for name in os.listdir(self.path):
+                if name.endswith((".f64", ".i64")):
+                    os.remove(os.path.join(self.path, name))
+
+        self._count = self._allocate(COUNT_FILE, np.int64, 1)
+        self.timestamps = self._allocate(TIMESTAMP_FILE, np.float64, self.capacity)
+        if meta is None:
+            self._save_meta()
+            return
+
+        for field, filename, integer in meta["fields"]:
+            key = _field_key(field)
+            self.columns[key] = self._allocate(filename, np.float64, self.capacity)
+            self.files[key] = filename
+            self.integer[key] = integer
+        self.static = meta.get("static", {})
+
+    def flush(self) -> None:
+        """Write dirty pages of a file-backed ring to disk"""
+        if self.path is None:
+            return
+        with self._lock:
+            for array in (self._count, self.timestamps, *self.columns.values()):
+                array.flush()
+
+    # --- writes --------------------------------------------------------
+
+    @property
+    def head(self) -> int:
+        """Slot the next sample is written to"""
+        return int(self._count[0] % self.capacity)
+
+    @property
+    def size(self) -> int:
+        return int(min(self._count[0], self.capacity))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _column(self, field: Hashable, value: Any) -> np.ndarray:
+        column = self.columns.get(field)
+        if column is None:
+            filename = f"col{len(self.columns)}.f64"
+            column = self._allocate(filename, np.float64, self.capacity)
+            # Only occupied slots need back-filling with NaN
+            if self.size:
+                column[self._physical()] = np.nan
+            self.columns[field] = column
+            self.files[field] = filename
+            self.integer[field] = isinstance(value, int)
+            self._save_meta()
+        return column
+
+    def append(self, timestamp: float, values: Dict[Hashable, Any]) -> None:
+        """Record one sample; numeric fields go to columns, the rest to static
+
+        Timestamps are kept non-decreasing (a sample stamped before the
+        newest one, e.g. after a clock step, takes the newest timestamp) so
+        lookups can binary-search them.
+        """
+        with self._lock:
+            count = int(self._count[0])
+            index = count % self.capacity
+            if count:
+                timestamp = max(timestamp, float(self.timestamps[(index - 1) % self.capacity]))
+            self.timestamps[index] = timestamp
+            seen = set()
+            static_changed = False
+            for field, value in values.items():
+                if is_number(value):
+                    self._column(field, value)[index] = value
+                    seen.add(field)
+                elif value is not None and not isinstance(value, (list, dict)):
+                    if self.static.get(field) != value:
+                        self.static[field] = value
+                        static_changed = True
+            # Slot is being reused: clear fields this sample did not carry
+            for field, column in self.columns.items():
+                if field not in seen:
+                    column[index] = np.nan
+            if static_changed:
+                self._save_meta()
+            # Publishing the new count commits the sample
+            self._count[0] = count + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._count[0] = 0
+
+    # --- reads ---------------------------------------------------------
+
+    @property
+    def sequence(self) -> int:
+        """Number of samples ever appended; sample n lives in slot n % capacity"""
+        return int(self._count[0])
+
+    def _oldest(self) -> int:
+        return self.head if self.size == self.capacity else 0
+
+    def _physical(self) -> np.ndarray:
+        """Array positions of the stored samples, oldest first"""
+        return (np.arange(self.size) + self._oldest()) % self.capacity
+
+    def _search(self, timestamp: float, side: str) -> int:
+        """Logical index (0 = oldest) of `timestamp` in the sorted timestamps
+
+        The stored samples form at most two sorted runs of the array, each
+        searched with np.searchsorted.
+        """
+        size = self.size
+        oldest = self._oldest()
+        first = self.timestamps[oldest:min(oldest + size, self.capacity)]
+        index = int(np.searchsorted(first, timestamp, side))
+        if index < len(first):
+            return index
+        second = self.timestamps[:size - len(first)]
+        return len(first) + int(np.searchsorted(second, timestamp, side))
+
+    def last_timestamp(self) -> Optional[float]:
+        """Timestamp of the newest sample, or None if empty"""
+        with self._lock:
+            if not self.size:
+                return None
+            return float(self.timestamps[(self.head - 1) % self.capacity])
+
+    def read(self, start: Optional[float] = None, end: Optional[float] = None,
+             after: Optional[int] = None) -> Tuple[np.ndarray, Dict[Hashable, np.ndarray], int]:
+        """Samples with start <= timestamp <= end and sequence >= after
+
+        Returns (timestamps, columns, next sequence), oldest first. Bounds are
+        found by binary search and only the selected samples are copied, so
+        a poll with `after` costs O(new samples).
+        """
+        with self._lock:
+            count = self.sequence
+            size = self.size
+            lo = 0 if start is None else self._search(start, "left")
+            hi = size if end is None else self._search(end, "right")
+            if after is not None:
+                # Sequence numbers before count - size have been overwritten
+                lo = max(lo, min(after, count) - (count - size))
+            positions = (np.arange(lo, max(lo, hi)) + self._oldest()) % self.capacity
+            timestamps = self.timestamps[positions]
+            columns = {field: column[positions] for field, column in self.columns.items()}
+        return np.asarray(timestamps), {field: np.asarray(column) for field, column in columns.items()}, count
+
+    def window(self, start: Optional[float] = None,
+               end: Optional[float] = None) -> Tuple[np.ndarray, Dict[Hashable, np.ndarray]]:
+        """Timestamps and columns with start <= timestamp <= end, oldest first"""
+        timestamps, columns, _ = self.read(start, end)
+        return timestamps, columns
+
+    def column_lists(self, columns: Dict[Hashable, np.ndarray]) -> Dict[Hashable, List[Any]]:
+        """Convert columns to Python lists, restoring ints; NaN marks absent"""
+        lists = {}
+        for field, column in columns.items():
+            values = column.tolist()
+            if self.integer.get(field):
+                values = [int(v) if v == v else v for v in values]
+            lists[field] = values
+        return lists
+
+    def build_rows(self, timestamps: np.ndarray, columns: Dict[Hashable, np.ndarray]) -> List[Dict[str, Any]]:
+        """[{"timestamp", "data"}] entries, the legacy history format, from window arrays"""
+        lists = self.column_lists(columns)
+        static = dict(self.static)
+        rows = []
+        for i, timestamp in enumerate(timestamps.tolist()):
+            data = {field: values[i] for field, values in lists.items() if values[i] == values[i]}
+            data.update(static)
+            rows.append({"timestamp": timestamp, "data": data})
+        return rows
+
+    def rows(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Window as [{"timestamp", "data"}] entries"""
+        return self.build_rows(*self.window(start, end))
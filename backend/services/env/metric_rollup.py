@@ -0,0 +1,514 @@
+"""Tiered, incrementally maintained rollups over a metric's raw history.
+
+A TieredHistory keeps the raw samples in a short MetricRing plus a chain of
+coarser RollupTiers (by default 10s for a day, 1min for 30 days and 1h for a
+year). Every bucket stores min/max/avg/last (plus the sample count) per
+numeric field. Tiers cascade:
+raw samples feed the finest tier, and each finished bucket is merged into the
+next tier, so one sample costs a handful of dict updates regardless of how
+many tiers exist.
+
+Queries pick the finest level that covers the requested window within a
+multiple of the caller's point budget and downsample the rest, so a 3-minute
+chart reads raw samples while a week-long chart reads 1min buckets. The
+bucket still being filled is included at the end so long-range charts stay
+current.
+
+attach() moves every level onto memory-mapped files under a directory so the
+whole history survives restarts; buckets that were still open at shutdown
+are rebuilt from the next finer level.
+
+Alongside the rollups, SketchTiers keep a quantile sketch per field and
+bucket (1min for a day, 1h for 30 days, 1 day for a year) so percentiles of
+any window are answered by merging a bounded number of bucket sketches.
+Sketches are saved to a single file every SKETCH_SAVE_INTERVAL seconds and
+on flush; after a restart, raw samples newer than the save are replayed.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.services.env import metric_sketch
+from backend.services.env.downsample import METHOD_LTTB, downsample_indices
+from backend.services.env.metric_ring import MetricRing, is_number
+from backend.services.env.metric_sketch import SketchTier
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+# (bucket seconds, retention seconds), finest first
+DEFAULT_TIERS = ((10, DAY), (60, 30 * DAY), (3600, 365 * DAY))
+
+# A level may hold this many times the point budget; the excess is
+# downsampled away, which keeps more detail than a coarser tier would
+OVERSAMPLE = 10
+
+# (bucket seconds, retention seconds) of the quantile sketch tiers
+DEFAULT_SKETCH_TIERS = ((60, DAY), (3600, 30 * DAY), (DAY, 365 * DAY))
+
+# Most bucket sketches merged for one quantile query
+MAX_SKETCH_BUCKETS = 1500
+
+SKETCH_FILE = "sketches.npz"
+SKETCH_FORMAT_VERSION = 2
+SKETCH_SAVE_INTERVAL = 600
+
+
+class Bucket:
+    """Running count/sum/min/max/last per field for one time bucket"""
+
+    __slots__ = ("start", "fields")
+
+    def __init__(self, start: float):
+        self.start = start
+        # field -> [count, total, low, high, last]
+        self.fields: Dict[str, list] = {}
+
+    @classmethod
+    def of_sample(cls, timestamp: float, values: Dict[str, Any]) -> "Bucket":
+        bucket = cls(timestamp)
+        for field, value in values.items():
+            if is_number(value):
+                bucket.fields[field] = [1, value, value, value, value]
+        return bucket
+
+    @classmethod
+    def of_stats(cls, start: float, stats: Dict[Tuple[str, str], Any]) -> "Bucket":
+        """Rebuild a bucket from the per-field stats a tier stored"""
+        bucket = cls(start)
+        for (stat, field), count in stats.items():
+            if stat != "count" or count != count:
+                continue
+            bucket.fields[field] = [count, stats[("avg", field)] * count, stats[("min", field)],
+                                    stats[("max", field)], stats[("last", field)]]
+        return bucket
+
+    def merge(self, other: "Bucket") -> None:
+        """Fold a later bucket (or single sample) into this one"""
+        for field, (count, total, low, high, last) in other.fields.items():
+            acc = self.fields.get(field)
+            if acc is None:
+                self.fields[field] = [count, total, low, high, last]
+                continue
+            acc[0] += count
+            acc[1] += total
+            if low < acc[2]:
+                acc[2] = low
+            if high > acc[3]:
+                acc[3] = high
+            acc[4] = last
+
+    def stats(self) -> Dict[Tuple[str, str], Any]:
+        """Per-field min/max/avg/last/count keyed by (stat, field)"""
+        values = {}
+        for field, (count, total, low, high, last) in self.fields.items():
+            values[("count", field)] = count
+            values[("min", field)] = low
+            values[("max", field)] = high
+            values[("avg", field)] = total / count
+            values[("last", field)] = last
+        return values
+
+
+class RollupTier:
+    """Fixed-resolution buckets of min/max/avg/last per field"""
+
+    __slots__ = ("resolution", "retention", "ring", "bucket")
+
+    def __init__(self, resolution: float, retention: float, path: Optional[str] = None):
+        self.resolution = resolution
+        self.retention = retention
+        self.ring = MetricRing(int(math.ceil(retention / resolution)), path)
+        self.bucket: Optional[Bucket] = None
+
+    def add(self, incoming: Bucket) -> Optional[Bucket]:
+        """Merge a finer bucket; returns the bucket it completed, if any"""
+        start = float(math.floor(incoming.start / self.resolution) * self.resolution)
+        completed = None
+        if self.bucket is not None and start != self.bucket.start:
+            completed = self.bucket
+            self.ring.append(completed.start, completed.stats())
+            self.bucket = None
+        if self.bucket is None:
+            self.bucket = Bucket(start)
+        self.bucket.merge(incoming)
+        if completed is not None:
+            # The next tier sees finished buckets only
+            return completed
+        return None
+
+    def clear(self) -> None:
+        self.ring.clear()
+        self.bucket = None
+
+
+def _rollup_row(timestamp: float, stats: Dict[Tuple[str, str], Any], static: Dict[str, Any]) -> Dict[str, Any]:
+    row = {"timestamp": timestamp, "data": {}, "min": {}, "max": {}, "last": {}}
+    for (stat, field), value in stats.items():
+        if stat == "count" or value != value:  # NaN: field absent from this bucket
+            continue
+        row["data" if stat == "avg" else stat][field] = value
+    row["data"].update(static)
+    return row
+
+
+class TieredHistory:
+    """Raw ring plus cascading rollup tiers for one metric type"""
+
+    def __init__(self, resolution: float, retention: float,
+                 tiers: Sequence[Tuple[float, float]] = DEFAULT_TIERS,
+                 sketch_tiers: Sequence[Tuple[float, float]] = DEFAULT_SKETCH_TIERS):
+        self.resolution = resolution
+        self.retention = retention
+        self.raw = MetricRing(int(math.ceil(retention / resolution)))
+        self.tiers = [RollupTier(res, keep) for res, keep in tiers]
+        self.sketches = [SketchTier(res, keep) for res, keep in sketch_tiers]
+        self.path: Optional[str] = None
+        self._sketches_saved = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    @property
+    def static(self) -> Dict[str, Any]:
+        return self.raw.static
+
+    def append(self, timestamp: float, values: Dict[str, Any]) -> None:
+        """Record a raw sample and roll it up through every tier"""
+        with self._lock:
+            self.raw.append(timestamp, values)
+            pending = Bucket.of_sample(timestamp, values)
+            for tier in self.tiers:
+                pending = tier.add(pending)
+                if pending is None:
+                    break
+            if self._sketch(timestamp, values) and self.path is not None \
+                    and time.monotonic() - self._sketches_saved >= SKETCH_SAVE_INTERVAL:
+                self._save_sketches()
+
+    def _sketch(self, timestamp: float, values: Dict[str, Any]) -> bool:
+        """Add a sample to the sketch tiers; True if it completed a bucket"""
+        if not self.sketches:
+            return False
+        completed = self.sketches[0].add_sample(timestamp, values)
+        if completed is None:
+            return False
+        for tier in self.sketches[1:]:
+            completed = tier.add_bucket(*completed)
+            if completed is None:
+                break
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.raw.clear()
+            for tier in self.tiers:
+                tier.clear()
+            for tier in self.sketches:
+                tier.clear()
+
+    def attach(self, directory: str) -> None:
+        """Back every level with memory-mapped files under `directory`
+
+        Existing files are reopened, so history recorded before a restart is
+        readable again. Open buckets are rebuilt from the finer level.
+        """
+        raw = MetricRing(self.raw.capacity, os.path.join(directory, "raw"))
+        tiers = [RollupTier(tier.resolution, tier.retention, os.path.join(directory, f"{tier.resolution:g}s"))
+                 for tier in self.tiers]
+        with self._lock:
+            self.raw = raw
+            self.tiers = tiers
+            self.path = directory
+            self._recover()
+            self._load_sketches()
+        logger.info(f"Metrics history in {directory}: {len(raw)} raw samples")
+
+    def _recover(self) -> None:
+        finer = self.raw
+        for tier in self.tiers:
+            last = tier.ring.last_timestamp()
+            start = None if last is None else last + tier.resolution
+            timestamps, columns = finer.window(start=start)
+            lists = finer.column_lists(columns)
+            for i, timestamp in enumerate(timestamps.tolist()):
+                values = {key: column[i] for key, column in lists.items()}
+                if finer is self.raw:
+                    bucket = Bucket.of_sample(timestamp, {k: v for k, v in values.items() if v == v})
+                else:
+                    bucket = Bucket.of_stats(timestamp, values)
+                tier.add(bucket)
+            finer = tier.ring
+
+    def _save_sketches(self) -> None:
+        """Write the sketch tiers to SKETCH_FILE; caller holds the lock"""
+        self._sketches_saved = time.monotonic()
+        meta = {"version": SKETCH_FORMAT_VERSION, "through": self.raw.last_timestamp()}
+        filename = os.path.join(self.path, SKETCH_FILE)
+        try:
+            with open(filename + ".tmp", "wb") as f:
+                metric_sketch.save_tiers(f, self.sketches, meta)
+            os.replace(filename + ".tmp", filename)
+        except Exception as e:
+            logger.error(f"Could not save quantile sketches in {self.path}: {e}")
+
+    def _load_sketches(self) -> None:
+        """Restore saved sketches and replay raw samples recorded after the save"""
+        if not self.sketches:
+            return
+        through = None
+        try:
+            meta, saved = metric_sketch.load_tiers(os.path.join(self.path, SKETCH_FILE))
+            if meta.get("version") == SKETCH_FORMAT_VERSION:
+                for tier in self.sketches:
+                    tier.clear()
+                    if tier.resolution in saved:
+                        tier.restore(saved[tier.resolution])
+                through = meta.get("through")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Discarding unreadable quantile sketches in {self.path}: {e}")
+            for tier in self.sketches:
+                tier.clear()
+
+        start = None if through is None else math.nextafter(through, math.inf)
+        timestamps, columns = self.raw.window(start=start)
+        for i, timestamp in enumerate(timestamps.tolist()):
+            self._sketch(timestamp, {field: column[i] for field, column in columns.items()})
+        self._sketches_saved = time.monotonic()
+
+    def flush(self) -> None:
+        """Write file-backed levels to disk"""
+        self.raw.flush()
+        for tier in self.tiers:
+            tier.ring.flush()
+        if self.path is not None and self.sketches:
+            with self._lock:
+                self._save_sketches()
+
+    def select(self, seconds: float, points: int) -> Optional[RollupTier]:
+        """Level to serve a window from: None for raw samples, else a tier
+
+        Among the levels whose retention covers the window, picks the finest
+        one holding at most OVERSAMPLE times `points` rows (the caller
+        downsamples the rest), but never a level so coarse that it has fewer
+        than `points` rows while a finer covering level exists. Windows
+        beyond retention use the coarsest level.
+        """
+        levels: List[Tuple[float, float, Optional[RollupTier]]] = [(self.resolution, self.retention, None)]
+        levels += [(tier.resolution, tier.retention, tier) for tier in self.tiers]
+        covering = [level for level in levels if level[1] >= seconds] or levels[-1:]
+        selected = covering[0][2]
+        for i, (resolution, _, tier) in enumerate(covering):
+            rows = seconds / resolution
+            if i and rows < points:
+                break  # Coarser than the budget; downsample the finer level instead
+            selected = tier
+            if rows <= points * OVERSAMPLE:
+                break
+        return selected
+
+    def level(self, resolution: float) -> Optional[RollupTier]:
+        """Level with the given resolution: None for raw samples, else a tier
+
+        Raises KeyError if no level has that resolution.
+        """
+        if resolution == self.resolution:
+            return None
+        for tier in self.tiers:
+            if tier.resolution == resolution:
+                return tier
+        raise KeyError(resolution)
+
+    def _read_level(self, start: Optional[float], tier: Optional[RollupTier], points: Optional[int],
+                    field: Optional[str], method: str,
+                    after: Optional[int] = None) -> Tuple[np.ndarray, Dict[Any, np.ndarray], int]:
+        """Window of one level, downsampled to `points` (one left for a tier's open bucket)"""
+        ring = self.raw if tier is None else tier.ring
+        key = field if tier is None else ("avg", field)
+        if start is not None and tier is not None:
+            start -= tier.resolution
+        timestamps, columns, sequence = ring.read(start=start, after=after)
+
+        if points is not None and tier is not None and tier.bucket is not None:
+            # Leave room for the open bucket appended by the caller
+            points = max(1, points - 1)
+        if points is not None and len(timestamps) > points and columns:
+            driver = columns.get(key)
+            if driver is None:
+                driver = next(iter(columns.values()))
+            keep = downsample_indices(timestamps, driver, points, method)
+            timestamps = timestamps[keep]
+            columns = {name: column[keep] for name, column in columns.items()}
+        return timestamps, columns, sequence
+
+    def columns(self, start: float, tier: Optional[RollupTier] = None, points: Optional[int] = None,
+                field: Optional[str] = None,
+                method: str = METHOD_LTTB) -> Tuple[List[float], Dict[str, List[Any]]]:
+        """Column-oriented window after `start`: (timestamps, {field: values})
+
+        Rollup levels contribute their per-bucket averages (the open bucket
+        included) under the plain field names, so raw and rollup windows look
+        alike. Missing values are None.
+        """
+        ring = self.raw if tier is None else tier.ring
+        timestamps, columns, _ = self._read_level(start, tier, points, field, method)
+        if tier is None:
+            keep = timestamps > start
+            timestamps = timestamps[keep]
+            columns = {name: column[keep] for name, column in columns.items()}
+        lists = ring.column_lists(columns)
+        if tier is not None:
+            lists = {name: values for (stat, name), values in lists.items() if stat == "avg"}
+            with self._lock:
+                current = tier.bucket
+                stats = current.stats() if current is not None else None
+            if stats:
+                timestamps = np.append(timestamps, current.start)
+                for name in set(lists) | {name for stat, name in stats if stat == "avg"}:
+                    lists[name] = lists.get(name, [None] * (len(timestamps) - 1)) + [stats.get(("avg", name))]
+        lists = {name: [None if v != v else v for v in values] for name, values in lists.items()}
+        return timestamps.tolist(), lists
+
+    def rows(self, start: Optional[float], tier: Optional[RollupTier] = None, points: Optional[int] = None,
+             field: Optional[str] = None, method: str = METHOD_LTTB,
+             after: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Rows at or after `start` from the raw ring or a rollup tier
+
+        Rollup rows carry averages under "data" (the raw row format) and the
+        bucket's "min", "max" and "last" values alongside; the still-open
+        bucket is always appended. With `after`, only samples or finished
+        buckets from that sequence number on are returned. With `points`,
+        rows are downsampled using `field` (default: the first column) as the
+        driver series; every field of a kept row is returned.
+
+        Returns (rows, sequence number to pass as `after` next time).
+        """
+        ring = self.raw if tier is None else tier.ring
+        timestamps, columns, sequence = self._read_level(start, tier, points, field, method, after)
+
+        if tier is None:
+            return ring.build_rows(timestamps, columns), sequence
+
+        static = dict(self.raw.static)
+        lists = ring.column_lists(columns)
+        rows = [_rollup_row(timestamp, {name: values[i] for name, values in lists.items()}, static)
+                for i, timestamp in enumerate(timestamps.tolist())]
+
+        with self._lock:
+            current = tier.bucket
+            stats = current.stats() if current is not None else None
+        if stats:
+            rows.append(_rollup_row(current.start, stats, static))
+        return rows, sequence
+
+    def quantiles(self, seconds: float, qs: Sequence[float],
+                  field: Optional[str] = None) -> Tuple[Optional[float], Dict[str, Tuple[int, List[float]]]]:
+        """Quantiles `qs` of each numeric field (or just `field`) over the last `seconds`
+
+        Windows within raw retention are answered exactly from the raw
+        samples. Longer ones merge the bucket sketches of the finest sketch
+        tier that covers the window within MAX_SKETCH_BUCKETS buckets (plus
+        the open buckets of the finer tiers), so their cost and memory do not
+        grow with the window. Values are then within the sketch's relative
+        accuracy.
+
+        Returns (resolution of the source level, {field: (sample count,
+        values)}); the resolution is 0 for exact answers from raw samples.
+        """
+        start = time.time() - seconds
+        if seconds <= self.retention or not self.sketches:
+            timestamps, columns = self.raw.window(start=start)
+            result = {}
+            for name, column in columns.items():
+                if field is not None and name != field:
+                    continue
+                present = column[~np.isnan(column)]
+                if len(present):
+                    result[name] = (len(present), np.quantile(present, qs).tolist())
+            return 0, result
+
+        covering = [tier for tier in self.sketches if tier.retention >= seconds] or self.sketches[-1:]
+        chosen = next((tier for tier in covering if seconds / tier.resolution <= MAX_SKETCH_BUCKETS),
+                      covering[-1])
+        with self._lock:
+            buckets = chosen.window(start)
+            for tier in self.sketches:
+                if tier is chosen:
+                    break
+                buckets.append(tier.frozen_open())
+
+        fields = {name for bucket in buckets for name in bucket}
+        if field is not None:
+            fields &= {field}
+        result = {}
+        for name in sorted(fields, key=str):
+            merged = metric_sketch.merge(bucket[name] for bucket in buckets if name in bucket)
+            values = metric_sketch.quantiles(merged, qs)
+            if values is not None:
+                result[name] = (metric_sketch.count(merged), values)
+        return chosen.resolution, result
+
+    def aligned(self, start: float, bucket: float, count: int,
+                fields: Optional[Sequence[str]] = None) -> Tuple[float, Dict[str, np.ndarray]]:
+        """Per-field means over `count` buckets of `bucket` seconds from `start`
+
+        `start` should be a multiple of `bucket` so rollup buckets, which
+        are aligned the same way, never straddle two output buckets. Reads the coarsest level that covers the window at a resolution no
+        coarser than `bucket` (the finest covering level if none is that
+        fine); rollup buckets are weighted by their sample counts. Empty
+        buckets are NaN. `fields` defaults to every numeric field.
+
+        Returns (resolution of the level read, {field: means}).
+        """
+        # Aligning start down to a bucket boundary may reach just past a level's retention
+        seconds = time.time() - start - bucket
+        levels: List[Tuple[float, float, Optional[RollupTier]]] = [(self.resolution, self.retention, None)]
+        levels += [(tier.resolution, tier.retention, tier) for tier in self.tiers]
+        covering = [level for level in levels if level[1] >= seconds] or levels[-1:]
+        fine = [level for level in covering if level[0] <= bucket]
+        resolution, _, tier = fine[-1] if fine else covering[0]
+
+        ring = self.raw if tier is None else tier.ring
+        timestamps, columns, _ = ring.read(start=start)
+        if tier is None:
+            values = columns
+            weights = {}
+        else:
+            values = {field: column for (stat, field), column in columns.items() if stat == "avg"}
+            weights = {field: column for (stat, field), column in columns.items() if stat == "count"}
+            with self._lock:
+                stats = tier.bucket.stats() if tier.bucket is not None else None
+                open_start = tier.bucket.start if tier.bucket is not None else None
+            if stats:
+                timestamps = np.append(timestamps, open_start)
+                for field in set(values) | {field for stat, field in stats if stat == "avg"}:
+                    values[field] = np.append(values.get(field, np.full(len(timestamps) - 1, np.nan)),
+                                              stats.get(("avg", field), np.nan))
+                    weights[field] = np.append(weights.get(field, np.full(len(timestamps) - 1, np.nan)),
+                                               stats.get(("count", field), np.nan))
+
+        index = np.floor((timestamps - start) / bucket).astype(np.int64)
+        inside = (index >= 0) & (index < count)
+        result = {}
+        for field in (fields if fields is not None else values):
+            column = values.get(field)
+            if column is None:
+                result[field] = np.full(count, np.nan)
+                continue
+            weight = weights.get(field)
+            weight = np.ones(len(column)) if weight is None else weight
+            keep = inside & ~np.isnan(column)
+            totals = np.bincount(index[keep], weights=column[keep] * weight[keep], minlength=count)
+            samples = np.bincount(index[keep], weights=weight[keep], minlength=count)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[field] = totals / samples
+        return resolution, result
@@ -0,0 +1,247 @@
+"""Optional write-behind sink that keeps metrics history in Postgres.
+
+Samples written to metrics history are also handed to the sink, which only
+appends them to a bounded in-memory queue; when the database is slow or down
+the queue drops its oldest samples instead of stalling the collector thread.
+A background thread flushes the queue every flush interval with a single
+COPY into a narrow table:
+
+    metric_series  (id, metric, field)            one row per series
+    metric_samples (ts, series_id, value)         partitioned by day
+
+Day partitions are created on demand and a retention pass drops partitions
+older than the configured number of days, which is far cheaper than DELETE.
+"""
+import io
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from backend.services.env.metric_ring import is_number
+
+logger = logging.getLogger(__name__)
+
+# Samples (one per collector tick) held while the database catches up
+MAX_PENDING_SAMPLES = 20000
+
+# Seconds between retention passes
+RETENTION_CHECK_INTERVAL = 3600
+
+PARTITION_PREFIX = "metric_samples_p"
+
+SCHEMA_STATEMENTS = (
+    """CREATE TABLE IF NOT EXISTS metric_series (
+        id SERIAL PRIMARY KEY,
+        metric TEXT NOT NULL,
+        field TEXT NOT NULL,
+        UNIQUE (metric, field)
+    )""",
+    """CREATE TABLE IF NOT EXISTS metric_samples (
+        ts TIMESTAMPTZ NOT NULL,
+        series_id INTEGER NOT NULL,
+        value DOUBLE PRECISION NOT NULL
+    ) PARTITION BY RANGE (ts)""",
+    "CREATE INDEX IF NOT EXISTS metric_samples_series_ts ON metric_samples (series_id, ts)",
+)
+
+
+def _partition_name(day: datetime) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+class MetricSink:
+    """Batches history samples and bulk-loads them into the database"""
+
+    def __init__(self, engine: Engine, flush_interval: float = 10.0, retention_days: int = 30,
+                 max_pending: int = MAX_PENDING_SAMPLES):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._queue: Deque[Tuple[float, str, Dict[str, Any]]] = deque(maxlen=max_pending)
+        self._queue_lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], int] = {}
+        self._partitions: set = set()
+        self._last_retention = 0.0
+        self._ready = False
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- producer side (collector thread) ------------------------------
+
+    def submit(self, metric_type: str, timestamp: float, values: Dict[str, Any]) -> None:
+        """Queue a sample; never blocks on the database"""
+        with self._queue_lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((timestamp, metric_type, values))
+
+    # --- flush thread --------------------------------------------------
+
+    def start(self) -> bool:
+        """Start the flush thread; False if the database is not supported"""
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        if self.engine.dialect.name != "postgresql":
+            logger.warning(f"Metric sink needs PostgreSQL, not {self.engine.dialect.name}; disabled")
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-sink", daemon=True)
+        self._thread.start()
+        logger.info(f"Metric sink started (flush every {self.flush_interval}s, "
+                    f"keeping {self.retention_days} days)")
+        return True
+
+    def stop(self) -> None:
+        """Stop the thread after a final flush"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            stopping = self._stop.wait(self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - self._last_retention >= RETENTION_CHECK_INTERVAL:
+                    self._last_retention = time.monotonic()
+                    self.apply_retention()
+            except Exception as e:
+                logger.error(f"Metric sink flush failed: {e}")
+            if stopping:
+                return
+
+    def _ensure_schema(self, conn) -> None:
+        if self._ready:
+            return
+        for statement in SCHEMA_STATEMENTS:
+            conn.execute(text(statement))
+        self._ready = True
+
+    def _ensure_partitions(self, conn, timestamps: Iterable[float]) -> None:
+        days = {datetime.fromtimestamp(ts, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+                for ts in timestamps}
+        for day in sorted(days):
+            name = _partition_name(day)
+            if name in self._partitions:
+                continue
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF metric_samples "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+            self._partitions.add(name)
+
+    def _series_ids(self, conn, keys: Iterable[Tuple[str, str]]) -> None:
+        missing = [key for key in set(keys) if key not in self._series]
+        if not missing:
+            return
+        for metric, field in missing:
+            conn.execute(text("INSERT INTO metric_series (metric, field) VALUES (:metric, :field) "
+                              "ON CONFLICT (metric, field) DO NOTHING"), {"metric": metric, "field": field})
+        rows = conn.execute(text("SELECT id, metric, field FROM metric_series")).all()
+        self._series = {(metric, field): series_id for series_id, metric, field in rows}
+
+    def _take_batch(self) -> List[Tuple[float, str, Dict[str, Any]]]:
+        with self._queue_lock:
+            batch = list(self._queue)
+            self._queue.clear()
+        return batch
+
+    def _requeue(self, batch: List[Tuple[float, str, Dict[str, Any]]]) -> None:
+        """Put a failed batch back in front of newer samples, dropping the oldest overflow"""
+        with self._queue_lock:
+            merged = batch + list(self._queue)
+            overflow = max(0, len(merged) - self._queue.maxlen)
+            self.dropped += overflow
+            self._queue = deque(merged[overflow:], maxlen=self._queue.maxlen)
+
+    def flush(self) -> int:
+        """COPY every queued sample into the database; returns rows written"""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        samples = [(ts, metric, field, value) for ts, metric, values in batch
+                   for field, value in values.items() if is_number(value) and value == value]
+        try:
+            with self.engine.begin() as conn:
+                self._ensure_schema(conn)
+                self._ensure_partitions(conn, (ts for ts, _, _ in batch))
+                self._series_ids(conn, ((metric, field) for _, metric, field, _ in samples))
+
+            buffer = io.StringIO()
+            for ts, metric, field, value in samples:
+                stamp = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+                buffer.write(f"{stamp}\t{self._series[(metric, field)]}\t{float(value)!r}\n")
+            buffer.seek(0)
+
+            raw = self.engine.raw_connection()
+            try:
+                with raw.cursor() as cursor:
+                    cursor.copy_expert("COPY metric_samples (ts, series_id, value) FROM STDIN", buffer)
+                raw.commit()
+            finally:
+                raw.close()
+        except Exception:
+            # Anything cached inside a rolled-back transaction is suspect
+            self._ready = False
+            self._partitions.clear()
+            self._series = {}
+            self._requeue(batch)
+            raise
+
+        if self.dropped:
+            logger.warning(f"Metric sink dropped {self.dropped} samples while the database was behind")
+            self.dropped = 0
+        return len(samples)
+
+    def apply_retention(self) -> List[str]:
+        """Drop day partitions entirely older than the retention window"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        dropped = []
+        with self.engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = 'metric_samples'"
+            )).all()
+            for (name,) in rows:
+                day = name[len(PARTITION_PREFIX):]
+                if name.startswith(PARTITION_PREFIX) and day.isdigit() and day < cutoff:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                    self._partitions.discard(name)
+                    dropped.append(name)
+        if dropped:
+            logger.info(f"Metric sink retention dropped partitions: {', '.join(dropped)}")
+        return dropped
+
+
+_sink: Optional[MetricSink] = None
+
+
+def get_metric_sink() -> Optional[MetricSink]:
+    """The running sink, or None when durable metrics are disabled"""
+    return _sink
+
+
+def start_metric_sink(engine: Engine, flush_interval: float, retention_days: int) -> Optional[MetricSink]:
+    """Create and start the process-wide sink; None if it cannot run here"""
+    global _sink
+    if _sink is None:
+        sink = MetricSink(engine, flush_interval, retention_days)
+        if sink.start():
+            _sink = sink
+    return _sink
+
+
+def stop_metric_sink() -> None:
+    if _sink is not None:
+        _sink.stop()
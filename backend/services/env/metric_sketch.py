@@ -0,0 +1,249 @@
+"""Mergeable quantile sketches (DDSketch) for long-window percentiles.
+
+A DDSketch maps every value to a logarithmic bin so that any quantile it
+reports is within RELATIVE_ACCURACY of the true value, whatever the
+distribution. Sketches merge by adding bin counts, which is what makes
+per-bucket sketches useful: the p99 over a day is the quantile of the merged
+sketches of that day's buckets, without keeping a single raw sample.
+
+Open buckets use a small dict of bin counts. Finished buckets are frozen
+into a compact structured array (7 bytes per occupied bin); merging any
+number of them is one np.unique + np.bincount, and the merged result has at
+most as many bins as the key range allows, so memory is bounded regardless
+of the window length.
+
+SketchTiers keep one sketch per field per bucket and cascade like the
+rollup tiers: every finished bucket is merged into the next coarser tier.
+save_tiers()/load_tiers() persist them as plain arrays in one .npz file
+(JSON metadata, an index table and every bin concatenated), read back with
+allow_pickle=False.
+"""
+import json
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.services.env.metric_ring import is_number
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# Magnitudes below this count as zero; keeps keys within int16
+MIN_INDEXABLE = 1e-9
+MAX_KEY = 32767
+
+FROZEN_DTYPE = np.dtype([("sign", np.int8), ("key", np.int16), ("count", np.uint32)])
+
+# Live bins are keyed by sign * KEY_SPAN + key
+KEY_SPAN = 1 << 16
+
+EMPTY = np.zeros(0, dtype=FROZEN_DTYPE)
+
+
+def _bin(value: float) -> int:
+    magnitude = abs(value)
+    if magnitude < MIN_INDEXABLE:
+        return 0
+    key = min(MAX_KEY, max(-MAX_KEY, int(math.ceil(math.log(magnitude) / LOG_GAMMA))))
+    return (1 if value > 0 else -1) * KEY_SPAN + key
+
+
+class LiveSketch:
+    """Mutable sketch for a bucket that is still being filled"""
+
+    __slots__ = ("bins",)
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}
+
+    def add(self, value: float) -> None:
+        key = _bin(value)
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def merge_frozen(self, frozen: np.ndarray) -> None:
+        for sign, key, count in frozen.tolist():
+            combined = sign * KEY_SPAN + key
+            self.bins[combined] = self.bins.get(combined, 0) + count
+
+    def freeze(self) -> np.ndarray:
+        frozen = np.empty(len(self.bins), dtype=FROZEN_DTYPE)
+        for i, (combined, count) in enumerate(self.bins.items()):
+            sign = 0 if combined == 0 else (1 if combined > 0 else -1)
+            frozen[i] = (sign, combined - sign * KEY_SPAN, count)
+        return frozen
+
+
+def merge(frozen: Iterable[np.ndarray]) -> np.ndarray:
+    """Merge frozen sketches into one, summing counts per bin"""
+    parts = [part for part in frozen if len(part)]
+    if not parts:
+        return EMPTY
+    combined = np.concatenate(parts)
+    ids = combined["sign"].astype(np.int64) * KEY_SPAN + combined["key"]
+    unique, inverse = np.unique(ids, return_inverse=True)
+    counts = np.bincount(inverse, weights=combined["count"])
+    merged = np.empty(len(unique), dtype=FROZEN_DTYPE)
+    merged["sign"] = np.sign(unique)
+    merged["key"] = unique - merged["sign"].astype(np.int64) * KEY_SPAN
+    merged["count"] = counts
+    return merged
+
+
+def quantiles(frozen: np.ndarray, qs: Sequence[float]) -> Optional[List[float]]:
+    """Approximate quantiles of a frozen sketch, or None if it is empty"""
+    if not len(frozen):
+        return None
+    sign = frozen["sign"].astype(np.int64)
+    key = frozen["key"].astype(np.int64)
+    # Ascending value order: negatives by descending key, zero, positives by key
+    order = np.lexsort((sign * key, sign))
+    sign, key = sign[order], key[order]
+    cumulative = np.cumsum(frozen["count"][order].astype(np.float64))
+    total = cumulative[-1]
+    ranks = np.clip(np.asarray(qs, dtype=np.float64), 0.0, 1.0) * (total - 1)
+    positions = np.searchsorted(cumulative, ranks, side="right")
+    positions = np.minimum(positions, len(cumulative) - 1)
+    values = sign[positions] * 2 * np.power(GAMMA, key[positions]) / (GAMMA + 1)
+    return values.tolist()
+
+
+def count(frozen: np.ndarray) -> int:
+    return int(frozen["count"].sum()) if len(frozen) else 0
+
+
+class SketchTier:
+    """Per-field sketches for fixed-resolution buckets, finished ones frozen"""
+
+    __slots__ = ("resolution", "retention", "buckets", "start", "open")
+
+    def __init__(self, resolution: float, retention: float):
+        self.resolution = resolution
+        self.retention = retention
+        self.buckets: Deque[Tuple[float, Dict[Hashable, np.ndarray]]] = deque(
+            maxlen=int(math.ceil(retention / resolution)))
+        self.start: Optional[float] = None
+        self.open: Dict[Hashable, LiveSketch] = {}
+
+    def _roll(self, timestamp: float) -> Optional[Tuple[float, Dict[Hashable, np.ndarray]]]:
+        """Move to the bucket containing `timestamp`; returns the bucket it completed, if any"""
+        start = float(math.floor(timestamp / self.resolution) * self.resolution)
+        completed = None
+        if self.start is not None and start != self.start:
+            completed = (self.start, self.frozen_open())
+            self.buckets.append(completed)
+            self.open = {}
+        self.start = start
+        return completed
+
+    def _sketch(self, field: Hashable) -> LiveSketch:
+        sketch = self.open.get(field)
+        if sketch is None:
+            sketch = self.open[field] = LiveSketch()
+        return sketch
+
+    def add_sample(self, timestamp: float, values: Dict[Hashable, Any]):
+        """Add one raw sample; returns the (start, sketches) bucket it completed, if any"""
+        completed = self._roll(timestamp)
+        for field, value in values.items():
+            if is_number(value) and value == value:
+                self._sketch(field).add(value)
+        return completed
+
+    def add_bucket(self, start: float, sketches: Dict[Hashable, np.ndarray]):
+        """Merge a finished finer bucket; returns the bucket it completed, if any"""
+        completed = self._roll(start)
+        for field, frozen in sketches.items():
+            self._sketch(field).merge_frozen(frozen)
+        return completed
+
+    def frozen_open(self) -> Dict[Hashable, np.ndarray]:
+        return {field: sketch.freeze() for field, sketch in self.open.items()}
+
+    def window(self, start: float) -> List[Dict[Hashable, np.ndarray]]:
+        """Finished buckets overlapping [start, now) plus the open one"""
+        selected = [self.frozen_open()]
+        for bucket_start, sketches in reversed(self.buckets):
+            if bucket_start + self.resolution <= start:
+                break
+            selected.append(sketches)
+        return selected
+
+    def clear(self) -> None:
+        self.buckets.clear()
+        self.start = None
+        self.open = {}
+
+    def state(self) -> Tuple[List[Tuple[float, Dict[Hashable, np.ndarray]]], Optional[float], Dict]:
+        return list(self.buckets), self.start, self.frozen_open()
+
+    def restore(self, state) -> None:
+        buckets, start, frozen = state
+        self.buckets.extend(buckets)
+        self.start = start
+        for field, sketch in frozen.items():
+            self._sketch(field).merge_frozen(sketch)
+
+
+def save_tiers(file, tiers: Sequence[SketchTier], meta: Dict[str, Any]) -> None:
+    """Write tier states to an .npz file (path or binary file object)
+
+    Every sketch becomes one row of the index (tier, bucket start - NaN for
+    the open bucket -, field id, bin count); the bins follow in index order.
+    """
+    fields: Dict[Hashable, int] = {}
+    tier_ids, starts, field_ids, lengths, parts = [], [], [], [], []
+
+    def add(tier_id: int, start: float, sketches: Dict[Hashable, np.ndarray]) -> None:
+        for field, frozen in sketches.items():
+            tier_ids.append(tier_id)
+            starts.append(start)
+            field_ids.append(fields.setdefault(field, len(fields)))
+            lengths.append(len(frozen))
+            parts.append(frozen)
+
+    for tier_id, tier in enumerate(tiers):
+        buckets, _, frozen = tier.state()
+        for start, sketches in buckets:
+            add(tier_id, start, sketches)
+        add(tier_id, math.nan, frozen)
+
+    meta = {**meta, "fields": list(fields),
+            "tiers": [{"resolution": tier.resolution, "start": tier.start} for tier in tiers]}
+    np.savez(file,
+             meta=np.array(json.dumps(meta)),
+             tier=np.array(tier_ids, dtype=np.int16),
+             start=np.array(starts, dtype=np.float64),
+             field=np.array(field_ids, dtype=np.int32),
+             length=np.array(lengths, dtype=np.int64),
+             bins=np.concatenate(parts) if parts else EMPTY)
+
+
+def load_tiers(file) -> Tuple[Dict[str, Any], Dict[float, Tuple]]:
+    """Read save_tiers() output: (meta, {resolution: SketchTier.restore() state})
+
+    Raises ValueError for malformed files.
+    """
+    with np.load(file, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        tier_ids, starts, field_ids, lengths = (data[key] for key in ("tier", "start", "field", "length"))
+        bins = data["bins"]
+    if bins.dtype != FROZEN_DTYPE or int(lengths.sum()) != len(bins):
+        raise ValueError("Sketch bins do not match their index")
+
+    fields = meta["fields"]
+    states = []
+    for tier in meta["tiers"]:
+        states.append(({}, tier["start"], {}))  # bucket start -> sketches, tier start, open bucket
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    for i, (tier_id, start, field_id) in enumerate(zip(tier_ids.tolist(), starts.tolist(), field_ids.tolist())):
+        buckets, _, frozen = states[tier_id]
+        sketches = frozen if start != start else buckets.setdefault(start, {})
+        sketches[fields[field_id]] = bins[offsets[i]:offsets[i + 1]]
+
+    restored = {}
+    for tier, (buckets, start, frozen) in zip(meta["tiers"], states):
+        restored[tier["resolution"]] = (list(buckets.items()), start, frozen)
+    return meta, restored
@@ -1,86 +1,275 @@
+import base64
+import math
+import os
 import time
-import threading
-from collections import deque
-from typing import Dict, List, Any
+import logging
+from typing import Dict, List, Any, Optional, Tuple
 
-# Store 5 minutes of 1s snapshots = 300 entries
-HISTORY_LENGTH = 300  # Reduced from 600 to 300 for 5-minute history
-RESET_INTERVAL = 300  # Reset history every 5 minutes
+import numpy as np
 
-cpu_history = deque(maxlen=HISTORY_LENGTH)
-memory_history = deque(maxlen=HISTORY_LENGTH)
-disk_history = deque(maxlen=HISTORY_LENGTH)
-network_history = deque(maxlen=HISTORY_LENGTH)
-gpu_history = deque(maxlen=HISTORY_LENGTH)
+from backend.services.env.downsample import METHOD_LTTB
+from backend.services.env.metric_rollup import TieredHistory, DAY
+from backend.services.env.metric_sink import get_metric_sink
 
-history_map: Dict[str, deque] = {
+logger = logging.getLogger(__name__)
+
+# Raw samples are kept for an hour; older data lives in the rollup tiers
+RAW_RETENTION = 3600
+
+# Default point budget when choosing between raw samples and rollups
+DEFAULT_POINTS = 1000
+
+# Most buckets on a batch response's shared time axis
+MAX_BATCH_BUCKETS = 10000
+
+# Reconnect backfill: at most this many points, reaching back at most a day
+BACKFILL_POINTS = 600
+MAX_BACKFILL_SECONDS = DAY
+
+# Series that drives downsampling unless the caller names one
+PRIMARY_FIELDS = {
+    "cpu": "cpu_usage",
+    "memory": "memory_percent",
+    "disk": "disk_percent",
+    "network": "rx",
+    "gpu": "gpu_utilization"
+}
+
+# Raw resolution is each type's history interval
+cpu_history = TieredHistory(1, RAW_RETENTION)
+memory_history = TieredHistory(1, RAW_RETENTION)
+disk_history = TieredHistory(5, RAW_RETENTION)
+network_history = TieredHistory(1, RAW_RETENTION)
+gpu_history = TieredHistory(5, RAW_RETENTION)
+# Per-service columns multiply with the number of services; one day of 1min
+services_history = TieredHistory(2, RAW_RETENTION, tiers=((60, DAY),), sketch_tiers=((60, DAY),))
+# Host PSI plus per-service cgroup columns
+pressure_history = TieredHistory(2, RAW_RETENTION, tiers=((60, DAY),), sketch_tiers=((60, DAY),))
+
+history_map: Dict[str, TieredHistory] = {
     "cpu": cpu_history,
     "memory": memory_history,
     "disk": disk_history,
     "network": network_history,
-    "gpu": gpu_history
+    "gpu": gpu_history,
+    "services": services_history,
+    "pressure": pressure_history
 }
 
 
-def log_metric(metric_type: str, data: Dict[str, Any]):
-    """Log a metric to the history deque with safeguards against overflows"""
-    if metric_type not in history_map:
+def _flatten_services(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn the column-packed services payload into "<service>.<field>" values"""
+    names = data.get("services") or []
+    flat = {}
+    for field, values in data.items():
+        if field == "services" or not isinstance(values, list) or len(values) != len(names):
+            continue
+        for name, value in zip(names, values):
+            flat[f"{name}.{field}"] = value
+    return flat
+
+
+def log_metric(metric_type: str, data: Dict[str, Any], timestamp: Optional[float] = None):
+    """Append a sample to the metric type's raw ring and rollup tiers"""
+    history = history_map.get(metric_type)
+    if history is None:
         return
-        
+
     try:
-        # Get current timestamp
-        current_time = time.time()
-        
-        # Create entry with consistent format for all metrics
+        current_time = time.time() if timestamp is None else timestamp
+
         if metric_type == "gpu":
-            # For GPU metrics, maintain same format as other metrics for consistency
-            entry = {
-                "timestamp": current_time,
-                "data": {  # Use nested data like other metrics
-                    "gpu_utilization": float(data.get("gpu_utilization", data.get("gpu_usage", 0))),
-                    "mem_utilization": float(data.get("mem_utilization", data.get("gpu_mem", 0))),
-                    "temperature": float(data.get("temperature", data.get("gpu_temp", 0))),
-                    "gpu_type": data.get("gpu_type", "NVIDIA GPU"),
-                    "gpu_mem_total": float(data.get("gpu_mem_total", 1))
-                }
+            # Normalise legacy GPU field names
+            values = {
+                "gpu_utilization": float(data.get("gpu_utilization", data.get("gpu_usage", 0))),
+                "mem_utilization": float(data.get("mem_utilization", data.get("gpu_mem", 0))),
+                "temperature": float(data.get("temperature", data.get("gpu_temp", 0))),
+                "gpu_type": data.get("gpu_type", "NVIDIA GPU"),
+                "gpu_mem_total": float(data.get("gpu_mem_total", 1))
             }
+        elif metric_type == "services":
+            values = _flatten_services(data)
+        elif metric_type == "pressure":
+            values = {field: value for field, value in data.items() if not isinstance(value, list)}
+            values.update(_flatten_services(data))
         else:
-            # For other metrics, use the standard format
-            entry = {
-                "timestamp": current_time,
-                "data": data
-            }
-        
-        # Use try/finally with a lock to safely append
-        history_map[metric_type].append(entry)
+            values = data
+
+        history.append(current_time, values)
+
+        sink = get_metric_sink()
+        if sink is not None:
+            sink.submit(metric_type, current_time, values)
     except Exception as e:
-        # Log the error
-        print(f"Error logging metric {metric_type}: {e}")
-        pass
+        logger.error(f"Error logging metric {metric_type}: {e}")
+
+
+def get_history(metric_type: str) -> Optional[TieredHistory]:
+    """The tiered store backing a metric type, or None if unknown"""
+    return history_map.get(metric_type)
+
+
+def encode_cursor(resolution: float, sequence: int) -> str:
+    """Opaque cursor naming a history level and the next sequence number"""
+    return base64.urlsafe_b64encode(f"{resolution:g}:{sequence}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        resolution, sequence = text.split(":")
+        return float(resolution), int(sequence)
+    except Exception:
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+
+
+def query_metric_history(metric_type: str, seconds: float, points: int = DEFAULT_POINTS,
+                         field: Optional[str] = None, method: str = METHOD_LTTB,
+                         since: Optional[float] = None,
+                         cursor: Optional[str] = None) -> Tuple[Optional[float], List[Dict[str, Any]], Optional[str]]:
+    """History for the last `seconds`, at most about `points` rows
+
+    Reads the best-fitting tier and downsamples it with `method` ("lttb" or
+    "minmax") driven by `field`. `since` (a timestamp) or `cursor` (from a
+    previous call) restrict the result to newer data; a cursor also pins the
+    level it was issued for. Stale cursors (e.g. after a history reset) fall
+    back to the full window.
+
+    Returns (resolution in seconds, rows, cursor for the next poll); rows
+    from rollup tiers also carry per-bucket "min", "max" and "last" values.
+    Resolution and cursor are None for an unknown metric type.
+    """
+    history = history_map.get(metric_type)
+    if history is None:
+        return None, [], None
+
+    points = max(1, points)
+    start = time.time() - seconds
+    if since is not None:
+        start = max(start, since)
+
+    after = None
+    tier = history.select(seconds, points)
+    if cursor is not None:
+        resolution, sequence = decode_cursor(cursor)
+        try:
+            tier = history.level(resolution)
+            ring = history.raw if tier is None else tier.ring
+            if sequence <= ring.sequence:
+                after = sequence
+        except KeyError:
+            pass
+
+    resolution = history.resolution if tier is None else tier.resolution
+    field = field or PRIMARY_FIELDS.get(metric_type)
+    rows, sequence = history.rows(start, tier, points, field, method, after)
+    return resolution, rows, encode_cursor(resolution, sequence)
+
+
+def query_metric_quantiles(metric_type: str, seconds: float, qs: List[float],
+                           field: Optional[str] = None) -> Tuple[Optional[float], Dict[str, Dict[str, Any]]]:
+    """Quantiles of every numeric field (or `field`) over the last `seconds`
+
+    Returns (source resolution, {field: {"count": samples, "values": {q: value}}});
+    resolution 0 means exact values from raw samples, None an unknown metric type.
+    """
+    history = history_map.get(metric_type)
+    if history is None:
+        return None, {}
+
+    resolution, result = history.quantiles(seconds, qs, field)
+    return resolution, {
+        name: {"count": count, "values": {f"{q:g}": value for q, value in zip(qs, values)}}
+        for name, (count, values) in result.items()
+    }
+
+
+def query_metric_batch(series: Dict[str, Optional[List[str]]], seconds: float,
+                       bucket: Optional[float] = None) -> Dict[str, Any]:
+    """Several metric types on one shared time axis, column-oriented
+
+    `series` maps metric types to the fields wanted (None: every numeric
+    field). The window is cut into buckets of `bucket` seconds (default:
+    about DEFAULT_POINTS buckets, at most MAX_BATCH_BUCKETS) aligned to
+    multiples of the bucket size, and each field is averaged per bucket.
+
+    Returns {"start", "bucket", "count", "resolution": {type: seconds},
+    "columns": {"<type>:<field>": [mean or None per bucket]}}; the time of
+    bucket i is start + i * bucket. Unknown metric types are left out.
+    """
+    bucket = max(bucket or seconds / DEFAULT_POINTS, seconds / MAX_BATCH_BUCKETS)
+    end = time.time()
+    start = math.floor((end - seconds) / bucket) * bucket
+    count = int(math.floor((end - start) / bucket)) + 1
+
+    resolutions = {}
+    columns = {}
+    for metric_type, fields in series.items():
+        history = history_map.get(metric_type)
+        if history is None:
+            continue
+        resolutions[metric_type], values = history.aligned(start, bucket, count, fields)
+        for field, column in values.items():
+            # Bucket means carry no meaningful precision past a few decimals
+            columns[f"{metric_type}:{field}"] = [None if v != v else v for v in np.round(column, 3).tolist()]
+    return {"start": start, "bucket": bucket, "count": count, "resolution": resolutions, "columns": columns}
+
+
+def backfill_metric_history(metric_type: str, since: float,
+                            points: int = BACKFILL_POINTS) -> Optional[Dict[str, Any]]:
+    """Compact history newer than `since` for a reconnecting stream client
+
+    Returns {"metric_type", "resolution", "timestamps", "columns": {field:
+    [...]}, "static"} with at most about `points` samples (downsampled on
+    the type's primary field; rollup buckets for gaps longer than raw
+    retention), or None if the type is unknown or nothing is newer.
+    """
+    history = history_map.get(metric_type)
+    if history is None:
+        return None
+
+    since = max(since, time.time() - MAX_BACKFILL_SECONDS)
+    seconds = time.time() - since
+    if seconds <= 0:
+        return None
+    tier = history.select(seconds, points)
+    timestamps, columns = history.columns(since, tier, points, PRIMARY_FIELDS.get(metric_type))
+    if not timestamps:
+        return None
+    return {
+        "metric_type": metric_type,
+        "resolution": history.resolution if tier is None else tier.resolution,
+        "timestamps": timestamps,
+        "columns": columns,
+        "static": dict(history.static)
+    }
+
+
+def attach_history(directory: str) -> None:
+    """Persist every metric type's history under `directory` (one subdirectory each)
+
+    History already on disk is reopened, so it survives backend restarts.
+    Types whose files cannot be opened keep their in-memory history.
+    """
+    for metric_type, history in history_map.items():
+        try:
+            history.attach(os.path.join(directory, metric_type))
+        except Exception as e:
+            logger.error(f"Could not persist {metric_type} history in {directory}: {e}")
+
 
+def flush_all_history() -> None:
+    """Write persisted history to disk, e.g. on shutdown"""
+    for metric_type, history in history_map.items():
+        try:
+            history.flush()
+        except Exception as e:
+            logger.error(f"Error flushing {metric_type} history: {e}")
 
-def get_metric_history(metric_type: str) -> List[Dict[str, Any]]:
-    if metric_type not in history_map:
-        return []
 
-    return list(history_map[metric_type])
-    
-    
 def reset_all_history():
     """Clear all metric history data"""
-    for history_queue in history_map.values():
-        history_queue.clear()
-    print("[Metrics] History reset completed")
-    
-
-# Initialize periodic history reset
-def start_periodic_reset():
-    """Start a background thread that resets history every RESET_INTERVAL seconds"""
-    def reset_timer():
-        while True:
-            time.sleep(RESET_INTERVAL)
-            reset_all_history()
-    
-    reset_thread = threading.Thread(target=reset_timer, daemon=True)
-    reset_thread.start()
-    print(f"[Metrics] Periodic history reset initialized (every {RESET_INTERVAL} seconds)")
+    for history in history_map.values():
+        history.clear()
+    logger.info("Metrics history reset completed")
@@ -0,0 +1,186 @@
+"""Process-wide NVML session shared by every GPU metrics consumer.
+
+nvmlInit() is by far the most expensive part of reading GPU metrics, so the
+session initialises NVML once, caches a handle for every device and keeps
+them until the driver reports an error. After an error the session shuts
+down and re-initialises on a later call, backing off between attempts so a
+host without a GPU does not pay for a failed init on every tick.
+
+All NVML calls are blocking; the metric hub reads the session from an
+isolated collector thread, never from the event loop. Tests can pass a fake
+module exposing the pynvml functions used below.
+"""
+import logging
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before re-initialising NVML after a failure
+RETRY_INTERVAL = 30.0
+
+
+def _decode(value: Any) -> str:
+    """Older pynvml releases return bytes for strings"""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+class NvmlSession:
+    """Owns the NVML lifecycle and the cached device handles"""
+
+    def __init__(self, nvml: Optional[ModuleType] = None, retry_interval: float = RETRY_INTERVAL):
+        self._nvml = nvml
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._handles: List[Any] = []
+        self._names: List[str] = []
+        self._driver: Optional[str] = None
+        self._next_retry = 0.0
+
+    # --- lifecycle -----------------------------------------------------
+
+    def _load_nvml(self) -> Optional[ModuleType]:
+        if self._nvml is None:
+            try:
+                import pynvml
+                self._nvml = pynvml
+            except ImportError:
+                logger.warning("pynvml is not installed, GPU metrics disabled")
+                return None
+        return self._nvml
+
+    def _ensure_initialized(self) -> bool:
+        """Initialise NVML and cache device handles; caller holds the lock"""
+        if self._initialized:
+            return True
+        if time.monotonic() < self._next_retry:
+            return False
+
+        nvml = self._load_nvml()
+        if nvml is None:
+            self._next_retry = float("inf")
+            return False
+
+        try:
+            nvml.nvmlInit()
+        except Exception as e:
+            logger.warning(f"NVML initialisation failed: {str(e)}")
+            self._next_retry = time.monotonic() + self.retry_interval
+            return False
+
+        try:
+            count = nvml.nvmlDeviceGetCount()
+            self._handles = [nvml.nvmlDeviceGetHandleByIndex(i) for i in range(count)]
+            self._names = [_decode(nvml.nvmlDeviceGetName(h)) for h in self._handles]
+        except Exception as e:
+            logger.warning(f"NVML device discovery failed: {str(e)}")
+            self._shutdown_locked()
+            self._next_retry = time.monotonic() + self.retry_interval
+            return False
+
+        try:
+            self._driver = _decode(nvml.nvmlSystemGetDriverVersion())
+        except Exception as e:
+            logger.debug(f"NVML driver version unavailable: {str(e)}")
+
+        self._initialized = True
+        logger.info(f"NVML initialised with {len(self._handles)} device(s): {', '.join(self._names)}")
+        return True
+
+    def _shutdown_locked(self) -> None:
+        if self._initialized or self._handles:
+            try:
+                if self._nvml is not None:
+                    self._nvml.nvmlShutdown()
+            except Exception as e:
+                logger.debug(f"NVML shutdown failed: {str(e)}")
+        self._initialized = False
+        self._handles = []
+        self._names = []
+        self._driver = None
+
+    def shutdown(self) -> None:
+        """Release NVML; the next call will initialise it again"""
+        with self._lock:
+            self._shutdown_locked()
+            self._next_retry = 0.0
+
+    # --- queries -------------------------------------------------------
+
+    @property
+    def available(self) -> bool:
+        """Whether at least one GPU is usable, initialising NVML if needed"""
+        with self._lock:
+            return self._ensure_initialized() and bool(self._handles)
+
+    def device_names(self) -> List[str]:
+        with self._lock:
+            if not self._ensure_initialized():
+                return []
+            return list(self._names)
+
+    def driver_version(self) -> Optional[str]:
+        with self._lock:
+            if not self._ensure_initialized():
+                return None
+            return self._driver
+
+    def sample(self) -> List[Dict[str, Any]]:
+        """Read utilisation, memory and temperature for every cached device
+
+        Returns an empty list when NVML is unavailable. A driver error drops
+        the session so it is rebuilt on a later call.
+        """
+        with self._lock:
+            if not self._ensure_initialized():
+                return []
+
+            nvml = self._nvml
+            devices = []
+            try:
+                for index, handle in enumerate(self._handles):
+                    utilization = nvml.nvmlDeviceGetUtilizationRates(handle)
+                    memory = nvml.nvmlDeviceGetMemoryInfo(handle)
+                    devices.append({
+                        "index": index,
+                        "name": self._names[index],
+                        "gpu_usage": utilization.gpu,
+                        "gpu_mem": round((memory.used / memory.total) * 100.0, 1) if memory.total > 0 else 0,
+                        "gpu_mem_used": memory.used // (1024 * 1024),  # MB
+                        "gpu_mem_total": memory.total // (1024 * 1024),  # MB
+                        "gpu_temp": nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU),
+                    })
+            except Exception as e:
+                logger.warning(f"NVML error when reading GPU metrics, resetting session: {str(e)}")
+                self._shutdown_locked()
+                self._next_retry = time.monotonic() + self.retry_interval
+                return []
+
+            return devices
+
+
+_session: Optional[NvmlSession] = None
+_session_lock = threading.Lock()
+
+
+def get_nvml_session() -> NvmlSession:
+    """Return the process-wide NVML session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = NvmlSession()
+        return _session
+
+
+def set_nvml_session(session: Optional[NvmlSession]) -> None:
+    """Replace the process-wide session, e.g. with one built on a fake NVML"""
+    global _session
+    with _session_lock:
+        if _session is not None and _session is not session:
+            _session.shutdown()
+        _session = session
@@ -10,6 +10,9 @@ from backend.services.service_registry import get_all_services
 SUPERVISOR_RPC_URL = "http://localhost:9001/RPC2"
 SUPERVISOR_SOCKET_PATH = "/home/vaio/vaio-board/workspace/supervisor/supervisord.conf"  # adjust if needed
 
+# Socket timeout for PID lookups made from the metrics collector thread
+SUPERVISOR_PID_TIMEOUT = 2.0
+
 # Supervisor states returned by XML-RPC
 VALID_STATES = {
     "RUNNING",
@@ -22,6 +25,18 @@ VALID_STATES = {
     "UNKNOWN"
 }
 
+class TimeoutTransport(xmlrpc.client.Transport):
+    """XML-RPC transport whose HTTP connections time out instead of hanging"""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
 @lru_cache(maxsize=1)
 def get_supervisor_proxy():
     return xmlrpc.client.ServerProxy(SUPERVISOR_RPC_URL, allow_none=True)
@@ -99,6 +114,36 @@ def get_all_service_statuses() -> List[Dict[str, Any]]:
         "module_type": get_module_type_for_service(s)
     }) for s in services]
 
+def get_service_pids() -> Dict[str, Dict[str, Any]]:
+    """Map each Service row to its supervisor program's main PID and state.
+
+    Uses a single getAllProcessInfo call. Services supervisor does not know
+    about are omitted; stopped programs are reported with pid 0.
+
+    Called from metric collectors off the event loop, so it uses its own
+    proxy (ServerProxy is not thread-safe) with a short socket timeout: a
+    hung supervisord raises instead of stalling the caller.
+    """
+    proxy = xmlrpc.client.ServerProxy(SUPERVISOR_RPC_URL, allow_none=True,
+                                      transport=TimeoutTransport(SUPERVISOR_PID_TIMEOUT))
+    infos = proxy.supervisor.getAllProcessInfo()
+    by_name = {}
+    if isinstance(infos, list):
+        for info in infos:
+            if isinstance(info, dict) and "name" in info:
+                by_name[str(info["name"]).lower()] = info
+
+    result = {}
+    for service in get_all_services():
+        info = by_name.get(service.name.lower())
+        if info is None:
+            continue
+        result[service.name] = {
+            "pid": int(info.get("pid") or 0),
+            "state": info.get("statename", "UNKNOWN")
+        }
+    return result
+
 # === Control actions ===
 
 def start_service(name: str) -> Dict[str, Any]:
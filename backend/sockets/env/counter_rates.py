@@ -0,0 +1,77 @@
+"""Vectorised rate math over per-device cumulative counters.
+
+psutil reports per-NIC and per-disk counters as cumulative totals. The
+tracker keeps the previous snapshot as a (devices x fields) float64 array and
+turns consecutive snapshots into per-second deltas in a single array
+operation, so hosts with dozens of interfaces and block devices stay cheap.
+"""
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class CounterRateTracker:
+    """Turns successive {device: counters} snapshots into per-device deltas"""
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self.column = {field: i for i, field in enumerate(self.fields)}
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the previous snapshot so no delta spans an idle gap"""
+        self._names: List[str] = []
+        self._values: Optional[np.ndarray] = None
+        self._time: Optional[float] = None
+
+    def _to_array(self, names: List[str], counters: Dict[str, Any]) -> np.ndarray:
+        rows = [[getattr(counters[name], field, 0) for field in self.fields] for name in names]
+        return np.array(rows, dtype=np.float64).reshape(len(names), len(self.fields))
+
+    def _previous_aligned(self, names: List[str]) -> np.ndarray:
+        """Previous values re-indexed to the current device list
+
+        Devices that just appeared get NaN and therefore a zero delta.
+        """
+        if names == self._names:
+            return self._values
+        aligned = np.full((len(names), len(self.fields)), np.nan)
+        previous = {name: i for i, name in enumerate(self._names)}
+        rows = [(i, previous[name]) for i, name in enumerate(names) if name in previous]
+        if rows:
+            current_idx, previous_idx = zip(*rows)
+            aligned[list(current_idx)] = self._values[list(previous_idx)]
+        return aligned
+
+    def update(self, counters: Dict[str, Any], now: Optional[float] = None) -> Optional[Tuple[List[str], np.ndarray, float]]:
+        """Record a snapshot and return (names, deltas, seconds) since the last one
+
+        Returns None for the first snapshot. Negative deltas (counter wrap or
+        device reset) are clamped to zero.
+        """
+        now = time.time() if now is None else now
+        names = sorted(counters)
+        values = self._to_array(names, counters)
+
+        result = None
+        if self._values is not None and self._time is not None and now > self._time:
+            deltas = values - self._previous_aligned(names)
+            deltas = np.nan_to_num(deltas, nan=0.0)
+            np.clip(deltas, 0.0, None, out=deltas)
+            result = (names, deltas, now - self._time)
+
+        self._names = names
+        self._values = values
+        self._time = now
+        return result
+
+
+def safe_ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Element-wise numerator / denominator, 0 where the denominator is 0"""
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def to_list(values: np.ndarray, decimals: int = 2) -> List[float]:
+    """Round an array for JSON output"""
+    return np.round(values, decimals).tolist()
@@ -0,0 +1,65 @@
+"""Multiplexed /graph-all namespace: every metric type in one aligned frame.
+
+A dashboard showing CPU, memory, disk, network and GPU would otherwise open
+five namespaces and receive five separately timed emits per second. Here one
+sampler reads the latest snapshot of every requested collector from the
+shared MetricHub in a single pass and emits one metrics_update frame with a
+shared timestamp:
+
+    {"timestamp", "datetime", "cpu": {...}, "memory": {...}, ...,
+     "intervals": {"cpu": 1, "disk": 5, ...}}
+
+Clients pick metric types with the usual subscribe message, using the metric
+names as fields, e.g. {"fields": ["cpu", "pressure"], "interval": 2}. Clients
+that name none get DEFAULT_METRICS; every other collector (services,
+pressure, per-core, per-device) is opt-in, so a plain connect never makes the
+hub start sampling it. Reconnecting clients get one metrics_backfill per
+recorded type, tagged "metric_type".
+"""
+import logging
+from backend.services.env.metrics_history import history_map
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-all"
+
+# Sent to clients that do not subscribe to specific metric types
+DEFAULT_METRICS = ("cpu", "memory", "disk", "network", "gpu")
+
+
+def register_all_stream(sio):
+    """Register the multiplexed sampler on /graph-all
+
+    Register this after the per-metric streams so their collectors are in
+    the hub; collectors added later are picked up on the next tick anyway.
+    """
+    hub = get_metric_hub()
+    sampler = None
+
+    def collect_all_metrics(interval):
+        # Only read the metric types some active client asked for
+        names = sampler.requested_fields()
+
+        metrics, intervals = {}, {}
+        for name in names:
+            snapshot = hub.latest(name, NAMESPACE, interval)
+            if snapshot is not None:
+                metrics[name] = snapshot.metrics
+                intervals[name] = snapshot.interval
+        if not metrics:
+            return None  # Nothing published yet
+
+        # Effective sampling interval of each adaptive/slow collector
+        metrics["intervals"] = intervals
+        return metrics
+
+    # Reconnecting clients are backfilled for the default types
+    sampler = MetricSampler(sio, NAMESPACE, collect_all_metrics, interval=1,
+                            history_keys=tuple(key for key in DEFAULT_METRICS if key in history_map),
+                            default_fields=DEFAULT_METRICS)
+    sampler.register()
+
+    logger.info(f"Multiplexed metrics stream registered with collectors: {', '.join(hub.collectors)}")
+    return sampler
@@ -0,0 +1,88 @@
+"""Per-core CPU utilisation with a time breakdown on /graph-cpu-cores.
+
+/graph-cpu reports one host-wide percentage, which hides a single pegged
+core (a busy single-threaded Python service) as well as iowait and steal on
+virtualised hosts. This stream turns consecutive psutil.cpu_times(percpu=True)
+snapshots into a (cores x modes) delta array and derives every percentage
+with array math. Values are packed column-wise, one list per mode with one
+entry per core, so 128+ core hosts stay a handful of flat lists:
+
+    {"cores", "usage": [...], "user": [...], "system": [...], "iowait": [...],
+     "irq": [...], "softirq": [...], "steal": [...], "nice": [...],
+     "host": {"usage", "user", ...}, "busiest_core", "busiest_usage"}
+
+Modes the platform does not report (iowait, steal, ... outside Linux) are
+omitted.
+"""
+import logging
+import numpy as np
+import psutil
+from backend.sockets.env.counter_rates import safe_ratio, to_list
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-cpu-cores"
+
+# Modes reported per core, when the platform has them
+MODES = ("user", "nice", "system", "iowait", "irq", "softirq", "steal")
+
+# Not busy time
+IDLE_MODES = ("idle", "iowait")
+
+# Linux already counts guest time inside user/nice
+GUEST_MODES = ("guest", "guest_nice")
+
+
+class CpuCoreCollector:
+    """Collects per-core utilisation from cpu_times deltas"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._previous = None
+
+    def __call__(self):
+        times = psutil.cpu_times(percpu=True)
+        if not times:
+            return None
+        fields = type(times[0])._fields
+        current = np.array(times, dtype=np.float64)
+
+        previous = self._previous
+        self._previous = current
+        if previous is None or previous.shape != current.shape:
+            return None  # First sample, or cores went on/offline
+
+        # Counters can step back slightly on some kernels; never go negative
+        deltas = np.clip(current - previous, 0.0, None)
+        counted = [i for i, field in enumerate(fields) if field not in GUEST_MODES]
+        total = deltas[:, counted].sum(axis=1)
+        idle = deltas[:, [i for i, field in enumerate(fields) if field in IDLE_MODES]].sum(axis=1)
+        modes = [(mode, fields.index(mode)) for mode in MODES if mode in fields]
+
+        usage = np.clip(safe_ratio(total - idle, total) * 100.0, 0.0, 100.0)
+        host_total = total.sum()
+        busiest = int(np.argmax(usage))
+
+        metrics = {"cores": len(current), "usage": to_list(usage, 1)}
+        for mode, column in modes:
+            metrics[mode] = to_list(safe_ratio(deltas[:, column], total) * 100.0, 1)
+        host = {"usage": round(float((host_total - idle.sum()) / host_total * 100.0), 1) if host_total else 0.0}
+        for mode, column in modes:
+            host[mode] = round(float(deltas[:, column].sum() / host_total * 100.0), 1) if host_total else 0.0
+        metrics["host"] = host
+        metrics["busiest_core"] = busiest
+        metrics["busiest_usage"] = metrics["usage"][busiest]
+        return metrics
+
+
+def register_cpu_cores_stream(sio):
+    """Register the per-core CPU sampler on /graph-cpu-cores"""
+    hub = get_metric_hub()
+    hub.register_collector("cpu_cores", CpuCoreCollector(), interval=1)
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("cpu_cores", NAMESPACE), interval=1)
+    sampler.register()
+    return sampler
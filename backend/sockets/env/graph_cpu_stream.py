@@ -1,67 +1,51 @@
-import asyncio
 import psutil
-import time
-from datetime import datetime
-from backend.services.env.metrics_history import log_metric
+from backend.services.env.host_inventory import get_host_inventory
+from backend.services.env.host_sensors import get_host_sensors
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
 
-def register_cpu_stream(sio):
-    @sio.on("connect", namespace="/graph-cpu")
-    async def cpu_connect(sid, environ):  # pylint: disable=unused-function
-        """Socket.IO event handler for CPU stream connections"""
-        async def send_cpu_metrics():
-            try:
-                while True:
-                    timestamp = time.time()
-                    
-                    # CPU usage (%)
-                    cpu_usage = psutil.cpu_percent(interval=None)
+NAMESPACE = "/graph-cpu"
+
+
+def collect_cpu_metrics():
+    """Collect one CPU sample for the shared /graph-cpu sampler"""
+    # CPU usage (%)
+    cpu_usage = psutil.cpu_percent(interval=None)
+
+    # Memory usage (%)
+    memory = psutil.virtual_memory()
+    memory_usage = memory.percent
 
-                    # Memory usage (%)
-                    memory = psutil.virtual_memory()
-                    memory_usage = memory.percent
+    # Package temperature (°C) and RAPL power (W) from cached sysfs handles
+    sensors = get_host_sensors().read()
+    temperature = sensors.get("cpu_temperature")
 
-                    # CPU temperature (°C)
-                    # This system doesn't have temperature sensors psutil can access
-                    temperature = None
-                    
-                    # Get CPU model information
-                    cpu_model = ""
-                    try:
-                        # Try to get CPU model from /proc/cpuinfo (Linux)
-                        with open("/proc/cpuinfo", "r") as f:
-                            for line in f:
-                                if "model name" in line:
-                                    cpu_model = line.split(":", 1)[1].strip()
-                                    break
-                    except Exception:
-                        pass
+    # Static CPU facts come from the host inventory cache
+    inventory = get_host_inventory()
 
-                    # Metrics to log for history
-                    metrics = {
-                        "cpu_usage": cpu_usage,
-                        "memory_usage": memory_usage,
-                        "cpu_model": cpu_model,
-                        "cpu_cores": psutil.cpu_count(logical=True) or 0,
-                        "total_memory_gb": round(memory.total / (1024**3), 1)
-                    }
-                    
-                    # Only add temperature if we actually have a reading
-                    if temperature is not None:
-                        metrics["cpu_temperature"] = temperature
-                    
-                    # Log metrics to history service
-                    log_metric("cpu", metrics)
-                    
-                    payload = {
-                        "timestamp": float(timestamp),
-                        "datetime": datetime.fromtimestamp(timestamp).isoformat(),
-                        **metrics
-                    }
-                    
-                    await sio.emit("metrics_update", payload, to=sid, namespace="/graph-cpu")  # << corrected
-                    
-                    await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                pass
+    # Metrics to log for history
+    metrics = {
+        "cpu_usage": cpu_usage,
+        "memory_usage": memory_usage,
+        "cpu_model": inventory["cpu_model"],
+        "cpu_cores": inventory["logical_cores"],
+        "total_memory_gb": round(memory.total / (1024**3), 1)
+    }
 
-        sio.start_background_task(send_cpu_metrics)
+    # Only add temperature if we actually have a reading
+    if temperature is not None:
+        metrics["cpu_temperature"] = temperature
+    if "cpu_power_watts" in sensors:
+        metrics["cpu_power_watts"] = sensors["cpu_power_watts"]
+
+    return metrics
+
+
+def register_cpu_stream(sio):
+    """Register the shared CPU sampler on /graph-cpu"""
+    hub = get_metric_hub()
+    hub.register_collector("cpu", collect_cpu_metrics, interval=1, history_key="cpu", min_interval=0.25, max_interval=5)
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("cpu", NAMESPACE), interval=1,
+                            history_keys=("cpu",))
+    sampler.register()
+    return sampler
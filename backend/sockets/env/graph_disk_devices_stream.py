@@ -0,0 +1,94 @@
+"""Per-device disk I/O rates, IOPS and latency on /graph-disk-devices.
+
+/graph-disk only reports root usage and host-wide cumulative counters, which
+hides a single saturated device. This stream derives per-device rates from
+consecutive psutil.disk_io_counters(perdisk=True) snapshots and reports usage
+for every mounted partition. Values are packed column-wise, one list per
+field aligned with "devices" / "partitions".
+"""
+import logging
+import time
+import numpy as np
+import psutil
+from backend.sockets.env.counter_rates import CounterRateTracker, safe_ratio, to_list
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-disk-devices"
+
+DISK_FIELDS = ("read_count", "write_count", "read_bytes", "write_bytes",
+               "read_time", "write_time", "busy_time")
+
+# Mounted partitions rarely change; re-list them at most this often
+PARTITION_REFRESH_SECONDS = 60
+
+
+class DiskDeviceCollector:
+    """Collects per-device I/O rates and per-partition usage"""
+
+    def __init__(self):
+        self.tracker = CounterRateTracker(DISK_FIELDS)
+        self._partitions = []
+        self._partitions_listed = 0.0
+
+    def reset(self):
+        self.tracker.reset()
+
+    def _mountpoints(self):
+        now = time.monotonic()
+        if now - self._partitions_listed > PARTITION_REFRESH_SECONDS:
+            try:
+                self._partitions = [p.mountpoint for p in psutil.disk_partitions(all=False)]
+            except Exception as e:
+                logger.warning(f"Could not list disk partitions: {e}")
+            self._partitions_listed = now
+        return self._partitions
+
+    def _partition_usage(self):
+        mounts, total, used, percent = [], [], [], []
+        for mountpoint in self._mountpoints():
+            try:
+                usage = psutil.disk_usage(mountpoint)
+            except Exception:
+                continue  # Unmounted or inaccessible since the last listing
+            mounts.append(mountpoint)
+            total.append(usage.total)
+            used.append(usage.used)
+            percent.append(usage.percent)
+        return {"mountpoints": mounts, "total": total, "used": used, "percent": percent}
+
+    def __call__(self):
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        snapshot = self.tracker.update(counters)
+        if snapshot is None:
+            return None
+
+        names, deltas, seconds = snapshot
+        col = self.tracker.column
+        reads = deltas[:, col["read_count"]]
+        writes = deltas[:, col["write_count"]]
+
+        return {
+            "devices": names,
+            "read_iops": to_list(reads / seconds),
+            "write_iops": to_list(writes / seconds),
+            "read_bps": to_list(deltas[:, col["read_bytes"]] / seconds, 0),
+            "write_bps": to_list(deltas[:, col["write_bytes"]] / seconds, 0),
+            # Average time per completed request over the interval (ms)
+            "read_latency_ms": to_list(safe_ratio(deltas[:, col["read_time"]], reads)),
+            "write_latency_ms": to_list(safe_ratio(deltas[:, col["write_time"]], writes)),
+            # busy_time is in ms; not reported on every platform
+            "util_percent": to_list(np.clip(deltas[:, col["busy_time"]] / (seconds * 10.0), 0.0, 100.0), 1),
+            "partitions": self._partition_usage()
+        }
+
+
+def register_disk_devices_stream(sio):
+    """Register the per-device disk sampler on /graph-disk-devices"""
+    hub = get_metric_hub()
+    hub.register_collector("disk_devices", DiskDeviceCollector(), interval=2, isolated=True)
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("disk_devices", NAMESPACE), interval=2)
+    sampler.register()
+    return sampler
@@ -0,0 +1,85 @@
+"""Per-interface network rates on /graph-network-interfaces.
+
+/graph-network sums every NIC together, which hides a saturated link on
+multi-NIC hosts. This stream derives per-interface byte, packet, error and
+drop rates from consecutive psutil.net_io_counters(pernic=True) snapshots.
+Values are packed column-wise, one list per field aligned with "interfaces".
+"""
+import logging
+import time
+import numpy as np
+import psutil
+from backend.sockets.env.counter_rates import CounterRateTracker, safe_ratio, to_list
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-network-interfaces"
+
+NIC_FIELDS = ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv",
+              "errin", "errout", "dropin", "dropout")
+
+# Link state and speed rarely change; re-read them at most this often
+STATS_REFRESH_SECONDS = 60
+
+
+class NetworkInterfaceCollector:
+    """Collects per-interface rates plus link speed and utilisation"""
+
+    def __init__(self):
+        self.tracker = CounterRateTracker(NIC_FIELDS)
+        self._stats = {}
+        self._stats_read = 0.0
+
+    def reset(self):
+        self.tracker.reset()
+
+    def _link_stats(self):
+        now = time.monotonic()
+        if now - self._stats_read > STATS_REFRESH_SECONDS:
+            try:
+                self._stats = psutil.net_if_stats()
+            except Exception as e:
+                logger.warning(f"Could not read interface stats: {e}")
+            self._stats_read = now
+        return self._stats
+
+    def __call__(self):
+        counters = psutil.net_io_counters(pernic=True) or {}
+        snapshot = self.tracker.update(counters)
+        if snapshot is None:
+            return None
+
+        names, deltas, seconds = snapshot
+        col = self.tracker.column
+        rates = deltas / seconds
+        tx_bps = rates[:, col["bytes_sent"]]
+        rx_bps = rates[:, col["bytes_recv"]]
+
+        stats = self._link_stats()
+        speed_mbps = np.array([getattr(stats.get(name), "speed", 0) or 0 for name in names], dtype=np.float64)
+        # Busiest direction against the negotiated link speed
+        util = safe_ratio(np.maximum(tx_bps, rx_bps) * 8.0, speed_mbps * 1e6) * 100.0
+
+        return {
+            "interfaces": names,
+            "is_up": [bool(getattr(stats.get(name), "isup", False)) for name in names],
+            "speed_mbps": speed_mbps.astype(int).tolist(),
+            "tx_bps": to_list(tx_bps, 0),
+            "rx_bps": to_list(rx_bps, 0),
+            "tx_pps": to_list(rates[:, col["packets_sent"]], 1),
+            "rx_pps": to_list(rates[:, col["packets_recv"]], 1),
+            "errors_per_sec": to_list(rates[:, col["errin"]] + rates[:, col["errout"]]),
+            "drops_per_sec": to_list(rates[:, col["dropin"]] + rates[:, col["dropout"]]),
+            "util_percent": to_list(np.clip(util, 0.0, 100.0), 1)
+        }
+
+
+def register_network_interfaces_stream(sio):
+    """Register the per-interface sampler on /graph-network-interfaces"""
+    hub = get_metric_hub()
+    hub.register_collector("network_interfaces", NetworkInterfaceCollector(), interval=1)
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("network_interfaces", NAMESPACE), interval=1)
+    sampler.register()
+    return sampler
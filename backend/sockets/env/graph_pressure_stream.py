@@ -0,0 +1,209 @@
+"""Linux PSI and cgroup v2 resource pressure on /graph-pressure.
+
+CPU% and memory% say how busy the host is, not whether work is stalled.
+Pressure stall information (/proc/pressure/{cpu,memory,io}) reports the
+share of time tasks waited on each resource, and cgroup v2 adds the same per
+cgroup plus usage, limits and CPU throttling. This collector reports:
+
+- host PSI: "<resource>_<some|full>_<avg10|avg60|avg300>" as published by
+  the kernel, plus "<resource>_<some|full>_stall_percent" over the last
+  interval, derived from the cumulative stall totals;
+- per supervisor service, when its main process sits in a cgroup v2
+  hierarchy: column lists aligned with "services" (cgroup path, CPU use and
+  throttling from cpu.stat deltas, memory.current/memory.max and each
+  resource's "some" avg10 pressure).
+
+Services in the same cgroup (e.g. all children of supervisord) share its
+numbers; "cgroup" tells them apart. Both roots are configurable
+(config.PROC_ROOT / config.CGROUP_ROOT) so the collector can run against a
+fixture directory. Hosts without PSI report "available": false.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from backend.core.config import config
+from backend.services.status.status_checker import get_service_pids
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-pressure"
+
+RESOURCES = ("cpu", "memory", "io")
+AVERAGES = ("avg10", "avg60", "avg300")
+
+# Per-service columns, in payload order
+CGROUP_FIELDS = ("cgroup", "cpu_percent", "cpu_throttled_percent", "nr_throttled", "memory_current",
+                 "memory_max", "memory_percent", "oom_kills", "cpu_pressure", "memory_pressure", "io_pressure")
+
+# Supervisor/DB lookup of the service -> PID map, and PID -> cgroup
+PID_MAP_REFRESH_SECONDS = 10
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+
+def parse_pressure(text: Optional[str]) -> Dict[str, Dict[str, float]]:
+    """{"some": {"avg10", "avg60", "avg300", "total"}, "full": {...}} from a PSI file"""
+    pressure = {}
+    for line in (text or "").splitlines():
+        kind, _, rest = line.partition(" ")
+        values = {}
+        for item in rest.split():
+            key, _, value = item.partition("=")
+            try:
+                values[key] = float(value)
+            except ValueError:
+                continue
+        if values:
+            pressure[kind] = values
+    return pressure
+
+
+def parse_flat_keyed(text: Optional[str]) -> Dict[str, int]:
+    """cpu.stat / memory.events style "key value" lines"""
+    values = {}
+    for line in (text or "").splitlines():
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            values[key] = int(value)
+    return values
+
+
+def parse_limit(text: Optional[str]) -> Optional[int]:
+    """memory.max style value; None for "max" (unlimited) or unreadable"""
+    value = (text or "").strip()
+    return int(value) if value.isdigit() else None
+
+
+class PressureCollector:
+    """Samples host PSI and per-service cgroup v2 usage, limits and pressure"""
+
+    def __init__(self, proc_root: Optional[str] = None, cgroup_root: Optional[str] = None):
+        self.proc_root = proc_root or config.PROC_ROOT
+        self.cgroup_root = cgroup_root or config.CGROUP_ROOT
+        self._services = {}
+        # service -> (cgroup path as the kernel names it, directory under the root)
+        self._cgroups: Dict[str, Tuple[str, str]] = {}
+        self._services_read = 0.0
+        self.reset()
+
+    def reset(self):
+        # (monotonic time, cumulative value) per counter, for interval deltas
+        self._totals: Dict[tuple, tuple] = {}
+
+    def _rate(self, key: tuple, total: float, now: float) -> Optional[float]:
+        """Per-second increase of a cumulative counter since the previous tick"""
+        previous = self._totals.get(key)
+        self._totals[key] = (now, total)
+        if previous is None or now <= previous[0] or total < previous[1]:
+            return None
+        return (total - previous[1]) / (now - previous[0])
+
+    def _cgroup_of(self, pid: int) -> Optional[Tuple[str, str]]:
+        """(cgroup path, directory) of a process's cgroup v2, if it exists under the root"""
+        text = _read(os.path.join(self.proc_root, str(pid), "cgroup"))
+        for line in (text or "").splitlines():
+            # v2 entries are "0::/path"; v1 controllers have a non-zero id
+            if line.startswith("0::"):
+                cgroup = line[3:].strip()
+                path = os.path.join(self.cgroup_root, cgroup.lstrip("/"))
+                if os.path.isfile(os.path.join(path, "cgroup.procs")):
+                    return cgroup, path
+        return None
+
+    def _refresh_services(self, now: float) -> None:
+        if now - self._services_read < PID_MAP_REFRESH_SECONDS:
+            return
+        self._services_read = now
+        try:
+            self._services = get_service_pids()
+        except Exception as e:
+            logger.warning(f"Could not map services to supervisor PIDs: {e}")
+        cgroups = {}
+        for name, info in self._services.items():
+            if info.get("pid"):
+                cgroup = self._cgroup_of(info["pid"])
+                if cgroup is not None:
+                    cgroups[name] = cgroup
+        self._cgroups = cgroups
+
+    def _host_pressure(self, now: float) -> Dict[str, float]:
+        metrics = {}
+        for resource in RESOURCES:
+            pressure = parse_pressure(_read(os.path.join(self.proc_root, "pressure", resource)))
+            for kind, values in pressure.items():
+                prefix = f"{resource}_{kind}"
+                for average in AVERAGES:
+                    if average in values:
+                        metrics[f"{prefix}_{average}"] = values[average]
+                if "total" in values:
+                    # total is cumulative stall time in microseconds
+                    rate = self._rate(("host", resource, kind), values["total"], now)
+                    if rate is not None:
+                        metrics[f"{prefix}_stall_percent"] = round(min(rate / 1e4, 100.0), 2)
+        return metrics
+
+    def _cgroup_sample(self, cgroup: str, path: str, now: float) -> Dict[str, object]:
+        """Usage, limits and pressure of one cgroup"""
+        cpu = parse_flat_keyed(_read(os.path.join(path, "cpu.stat")))
+        # cpu.stat times are in microseconds; 1e4 us per second is 1%
+        usage = self._rate((path, "usage_usec"), cpu["usage_usec"], now) if "usage_usec" in cpu else None
+        throttled = (self._rate((path, "throttled_usec"), cpu["throttled_usec"], now)
+                     if "throttled_usec" in cpu else None)
+        current = parse_limit(_read(os.path.join(path, "memory.current")))
+        limit = parse_limit(_read(os.path.join(path, "memory.max")))
+        events = parse_flat_keyed(_read(os.path.join(path, "memory.events")))
+        sample = {
+            "cgroup": cgroup,
+            "cpu_percent": None if usage is None else round(usage / 1e4, 1),
+            "cpu_throttled_percent": None if throttled is None else round(throttled / 1e4, 1),
+            "nr_throttled": cpu.get("nr_throttled"),
+            "memory_current": current,
+            "memory_max": limit,
+            "memory_percent": round(current / limit * 100.0, 1) if current is not None and limit else None,
+            "oom_kills": events.get("oom_kill")
+        }
+        for resource in RESOURCES:
+            pressure = parse_pressure(_read(os.path.join(path, f"{resource}.pressure")))
+            sample[f"{resource}_pressure"] = pressure.get("some", {}).get("avg10")
+        return sample
+
+    def _service_columns(self, now: float) -> Dict[str, List]:
+        names = sorted(self._cgroups)
+        # Services sharing a cgroup read it once per tick
+        samples = {}
+        for cgroup, path in set(self._cgroups.values()):
+            samples[cgroup] = self._cgroup_sample(cgroup, path, now)
+        columns: Dict[str, List] = {"services": names}
+        for key in CGROUP_FIELDS:
+            columns[key] = [samples[self._cgroups[name][0]][key] for name in names]
+        return columns
+
+    def __call__(self):
+        now = time.monotonic()
+        self._refresh_services(now)
+        host = self._host_pressure(now)
+        return {
+            "available": bool(host),
+            **host,
+            **self._service_columns(now)
+        }
+
+
+def register_pressure_stream(sio):
+    """Register the PSI / cgroup sampler on /graph-pressure"""
+    hub = get_metric_hub()
+    hub.register_collector("pressure", PressureCollector(), interval=2, history_key="pressure",
+                           isolated=True)
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("pressure", NAMESPACE), interval=2,
+                            history_keys=("pressure",))
+    sampler.register()
+    return sampler
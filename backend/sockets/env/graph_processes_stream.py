@@ -0,0 +1,239 @@
+"""Incremental top-N process tables on /graph-processes.
+
+The first thing anyone does on a slow box is open a terminal and run top.
+This stream keeps the same view: the TOP_N processes by CPU, resident memory
+and disk I/O, one table per key ("cpu", "memory", "io" - usable as
+subscription fields).
+
+One psutil.process_iter() pass with a fixed attrs list reads every process
+per tick; process_iter reuses its cached Process objects, so cpu_percent is
+measured since the previous tick without blocking. Rankings are computed
+with np.argpartition; owner and thread count (from /proc/<pid>/status) are
+only read for the processes that made a table, which keeps thousands of
+PIDs cheap. The scan is a MetricHub collector like any other, registered
+isolated because walking /proc for every process can take a few hundred
+milliseconds on a busy host.
+
+The hub publishes full tables ({"order": [pid, ...], "rows": [...]}); the
+ProcessDeltaFramer turns them into per-client deltas against the frame each
+client last received:
+
+    {"seq", "base", "keyframe",
+     "order": [pid, ...] in rank order (only when the ranking changed),
+     "rows": [[pid, name, user, cpu_percent, rss, io_bps, threads, status], ...]
+             (processes that entered the table or whose values moved past
+             ROW_THRESHOLDS),
+     "removed": [pid, ...]}
+
+A client's first frame is a keyframe carrying every row, "order" and
+"columns". Values are compared against what the client was last sent, so
+small changes never accumulate into drift. Clients that received the same
+frame share one packet. Compact encodings carry only the process count, as
+they do not encode lists.
+"""
+import logging
+import pwd
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import psutil
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import ClientFramer, MetricSampler, build_payload
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-processes"
+
+TOP_N = 25
+
+# Read for every process; all but io_counters come from /proc/<pid>/stat and statm
+ATTRS = ["pid", "name", "cpu_percent", "memory_info", "io_counters", "status", "create_time"]
+
+COLUMNS = ("pid", "name", "user", "cpu_percent", "rss", "io_bps", "threads", "status")
+TABLES = ("cpu", "memory", "io")
+
+# column -> (absolute floor, relative change) a value must move by to be resent;
+# other columns are resent on any change
+ROW_THRESHOLDS = {
+    "cpu_percent": (1.0, 0.1),
+    "rss": (1024 * 1024, 0.05),
+    "io_bps": (64 * 1024, 0.1),
+    "threads": (1, 0.1),
+}
+_THRESHOLDS = [ROW_THRESHOLDS.get(column) for column in COLUMNS]
+
+Row = Tuple[Any, ...]
+
+
+def row_moved(old: Row, new: Row) -> bool:
+    """Whether a client showing `old` should be sent `new`"""
+    for threshold, before, after in zip(_THRESHOLDS, old, new):
+        if threshold is None or before is None or after is None:
+            if before != after:
+                return True
+        elif abs(after - before) > max(threshold[0], threshold[1] * abs(before)):
+            return True
+    return False
+
+
+class ProcessTableCollector:
+    """Scans every process once per tick and ranks the top-N tables"""
+
+    def __init__(self, top_n: int = TOP_N):
+        self.top_n = top_n
+        self._io: Dict[Tuple[int, float], int] = {}
+        self._io_time: Optional[float] = None
+        self._users: Dict[int, str] = {}
+
+    def reset(self):
+        self._io = {}
+        self._io_time = None
+
+    def _user(self, uid: Optional[int]) -> Optional[str]:
+        if uid is None:
+            return None
+        name = self._users.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            self._users[uid] = name
+        return name
+
+    def _top(self, values: np.ndarray) -> List[int]:
+        """Indices of the top_n largest values, largest first"""
+        if len(values) > self.top_n:
+            candidates = np.argpartition(-values, self.top_n - 1)[:self.top_n]
+        else:
+            candidates = np.arange(len(values))
+        return candidates[np.argsort(-values[candidates], kind="stable")].tolist()
+
+    def __call__(self) -> Dict[str, Any]:
+        """One pass over /proc; returns the process count and full tables"""
+        now = time.monotonic()
+        procs, infos = [], []
+        io_totals: Dict[Tuple[int, float], int] = {}
+        for proc in psutil.process_iter(ATTRS, ad_value=None):
+            info = proc.info
+            io = info["io_counters"]
+            if io is not None:
+                io_totals[(info["pid"], info["create_time"])] = io.read_bytes + io.write_bytes
+            procs.append(proc)
+            infos.append(info)
+
+        count = len(infos)
+        cpu = np.fromiter((info["cpu_percent"] or 0.0 for info in infos), dtype=np.float64, count=count)
+        rss = np.fromiter((info["memory_info"].rss if info["memory_info"] else 0 for info in infos),
+                          dtype=np.float64, count=count)
+        io_bps = np.zeros(count)
+        if self._io_time is not None and now > self._io_time:
+            seconds = now - self._io_time
+            previous = self._io
+            for i, info in enumerate(infos):
+                key = (info["pid"], info["create_time"])
+                if key in io_totals and key in previous:
+                    io_bps[i] = max(0, io_totals[key] - previous[key]) / seconds
+        self._io = io_totals
+        self._io_time = now
+
+        ranked = {"cpu": self._top(cpu), "memory": self._top(rss), "io": self._top(io_bps)}
+        rows: Dict[int, Row] = {}
+        for index in {i for indices in ranked.values() for i in indices}:
+            info = infos[index]
+            try:
+                with procs[index].oneshot():
+                    user, threads = self._user(procs[index].uids().real), procs[index].num_threads()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                user = threads = None
+            rows[index] = (info["pid"], info["name"], user, round(float(cpu[index]), 1), int(rss[index]),
+                           int(io_bps[index]), threads, info["status"])
+
+        metrics: Dict[str, Any] = {"processes": count}
+        for name, indices in ranked.items():
+            metrics[name] = {"order": [infos[i]["pid"] for i in indices], "rows": [rows[i] for i in indices]}
+        return metrics
+
+
+class ProcessDeltaFramer(ClientFramer):
+    """Per-client table deltas against the frame each client last received"""
+
+    def __init__(self):
+        # frame id -> {table: (order, pid -> row as the client sees it)}
+        self._visible: Dict[int, Dict[str, Tuple[List[int], Dict[int, Row]]]] = {}
+        # sid -> id of the last frame it was sent
+        self._clients: Dict[str, int] = {}
+        self._frame_id = 0
+
+    def _table(self, table: Dict[str, Any], previous: Optional[Tuple[List[int], Dict[int, Row]]],
+               base: int, seq: int) -> Tuple[Dict[str, Any], Tuple[List[int], Dict[int, Row]]]:
+        order = table["order"]
+        rows = dict(zip(order, table["rows"]))
+        if previous is None:
+            frame = {"seq": seq, "base": base, "keyframe": True, "order": order,
+                     "rows": table["rows"], "removed": [], "columns": COLUMNS}
+            return frame, (order, rows)
+
+        previous_order, previous_rows = previous
+        visible, changed = {}, []
+        for pid in order:
+            old, new = previous_rows.get(pid), rows[pid]
+            if old is None or row_moved(old, new):
+                changed.append(new)
+                visible[pid] = new
+            else:
+                visible[pid] = old
+        frame = {"seq": seq, "base": base, "keyframe": False, "rows": changed,
+                 "removed": [pid for pid in previous_order if pid not in rows]}
+        if order != previous_order:
+            frame["order"] = order
+        return frame, (order, visible)
+
+    def frames(self, sids: List[str], payload: Dict[str, Any]) -> List[Tuple[List[str], Dict[str, Any]]]:
+        groups: Dict[int, List[str]] = {}
+        for sid in sids:
+            groups.setdefault(self._clients.get(sid, 0), []).append(sid)
+
+        frames = []
+        for base, members in groups.items():
+            self._frame_id += 1
+            previous = self._visible.get(base, {})
+            frame, visible = dict(payload), {}
+            for name in TABLES:
+                if isinstance(payload.get(name), dict):
+                    frame[name], visible[name] = self._table(payload[name], previous.get(name),
+                                                             base, self._frame_id)
+            self._visible[self._frame_id] = visible
+            for sid in members:
+                self._clients[sid] = self._frame_id
+            frames.append((members, frame))
+        self._prune()
+        return frames
+
+    def discard(self, sid: str) -> None:
+        self._clients.pop(sid, None)
+        self._prune()
+
+    def _prune(self) -> None:
+        live = set(self._clients.values())
+        for frame_id in [frame_id for frame_id in self._visible if frame_id not in live]:
+            del self._visible[frame_id]
+
+
+def register_processes_stream(sio):
+    """Register the top-N process sampler on /graph-processes"""
+    hub = get_metric_hub()
+    hub.register_collector("processes", ProcessTableCollector(), interval=1, isolated=True)
+    framer = ProcessDeltaFramer()
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("processes", NAMESPACE), interval=2,
+                            min_interval=1, framer=framer)
+
+    async def processes_connect(sid):
+        """Send the current tables as the client's first keyframe"""
+        snapshot = hub.snapshot("processes")
+        if snapshot is not None:
+            for recipients, frame in framer.frames([sid], build_payload(snapshot.timestamp, snapshot.metrics)):
+                await sio.emit("metrics_update", frame, to=recipients, namespace=NAMESPACE)
+
+    sampler.register(on_connect=processes_connect)
+    return sampler
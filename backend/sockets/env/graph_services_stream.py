@@ -0,0 +1,169 @@
+"""Per-service process resource attribution on /graph-services.
+
+Host totals cannot show which supervisor service is eating CPU or RAM. This
+collector maps every Service row to its supervisor PID and the process tree
+below it, then sums CPU%, RSS, PSS, threads, open fds and disk I/O per
+service. psutil.Process objects are cached between ticks so cpu_percent()
+measures the interval since the previous tick instead of blocking.
+
+The PID map and process trees are refreshed every few seconds rather than
+every tick, and PSS (which requires reading smaps) less often still. Values
+are packed column-wise, one list per field aligned with "services".
+"""
+import logging
+import time
+from collections import namedtuple
+import psutil
+from backend.services.status.status_checker import get_service_pids
+from backend.sockets.env.counter_rates import CounterRateTracker, to_list
+from backend.sockets.env.metric_hub import get_metric_hub
+from backend.sockets.env.metric_sampler import MetricSampler
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/graph-services"
+
+# Supervisor/DB lookup of the service -> PID map
+PID_MAP_REFRESH_SECONDS = 10
+# Walk of each service's child processes
+TREE_REFRESH_SECONDS = 5
+# smaps_rollup read for proportional set size
+PSS_REFRESH_SECONDS = 30
+
+IoTotals = namedtuple("IoTotals", ["read_bytes", "write_bytes"])
+
+
+class ServiceProcessCollector:
+    """Samples resource usage per supervisor service process tree"""
+
+    def __init__(self):
+        self.io_tracker = CounterRateTracker(IoTotals._fields)
+        self._services = {}
+        self._services_read = 0.0
+        self._trees = {}
+        self._trees_read = 0.0
+        self._procs = {}
+        self._pss = {}
+        self._pss_read = 0.0
+
+    def reset(self):
+        self.io_tracker.reset()
+
+    def _process(self, pid):
+        """Cached Process object so cpu_percent() has a previous reading"""
+        proc = self._procs.get(pid)
+        if proc is None:
+            proc = psutil.Process(pid)
+            proc.cpu_percent(None)  # Prime; the first reading is meaningless
+            self._procs[pid] = proc
+        return proc
+
+    def _refresh_services(self, now):
+        if now - self._services_read < PID_MAP_REFRESH_SECONDS:
+            return
+        try:
+            self._services = get_service_pids()
+        except Exception as e:
+            logger.warning(f"Could not map services to supervisor PIDs: {e}")
+        self._services_read = now
+        self._trees_read = 0.0  # PIDs may have changed
+
+    def _refresh_trees(self, now):
+        if now - self._trees_read < TREE_REFRESH_SECONDS:
+            return
+        trees = {}
+        for name, info in self._services.items():
+            pid = info["pid"]
+            if not pid:
+                continue
+            try:
+                root = self._process(pid)
+                trees[name] = [root] + [self._process(child.pid) for child in root.children(recursive=True)]
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self._trees = trees
+        self._trees_read = now
+
+        # Drop cached processes that are no longer in any tree
+        live = {proc.pid for procs in trees.values() for proc in procs}
+        for pid in list(self._procs):
+            if pid not in live:
+                del self._procs[pid]
+
+    def __call__(self):
+        now = time.monotonic()
+        self._refresh_services(now)
+        self._refresh_trees(now)
+        read_pss = now - self._pss_read >= PSS_REFRESH_SECONDS
+        if read_pss:
+            self._pss_read = now
+
+        names = sorted(self._services)
+        columns = {key: [] for key in ("cpu_percent", "rss", "threads", "fds", "processes")}
+        io_totals = {}
+
+        for name in names:
+            cpu = rss = pss = threads = fds = count = read_bytes = write_bytes = 0
+            for proc in self._trees.get(name, []):
+                # Read everything first so a process that vanishes or denies a read adds nothing
+                try:
+                    with proc.oneshot():
+                        proc_cpu = proc.cpu_percent(None)
+                        proc_rss = proc.memory_info().rss
+                        proc_threads = proc.num_threads()
+                        proc_fds = proc.num_fds()
+                        try:
+                            io = proc.io_counters()
+                            proc_read, proc_write = io.read_bytes, io.write_bytes
+                        except (psutil.AccessDenied, AttributeError):
+                            proc_read = proc_write = 0
+                        proc_pss = 0
+                        if read_pss:
+                            proc_pss = getattr(proc.memory_full_info(), "pss", 0)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+                cpu += proc_cpu
+                rss += proc_rss
+                threads += proc_threads
+                fds += proc_fds
+                read_bytes += proc_read
+                write_bytes += proc_write
+                pss += proc_pss
+                count += 1
+            columns["cpu_percent"].append(round(cpu, 1))
+            columns["rss"].append(rss)
+            columns["threads"].append(threads)
+            columns["fds"].append(fds)
+            columns["processes"].append(count)
+            if read_pss:
+                self._pss[name] = pss
+            io_totals[name] = IoTotals(read_bytes, write_bytes)
+
+        snapshot = self.io_tracker.update(io_totals)
+        if snapshot is not None:
+            _, deltas, seconds = snapshot
+            read_bps = to_list(deltas[:, 0] / seconds, 0)
+            write_bps = to_list(deltas[:, 1] / seconds, 0)
+        else:
+            read_bps = write_bps = [0.0] * len(names)
+
+        return {
+            "services": names,
+            "state": [self._services[name]["state"] for name in names],
+            "pid": [self._services[name]["pid"] for name in names],
+            **columns,
+            "pss": [self._pss.get(name, 0) for name in names],
+            "read_bps": read_bps,
+            "write_bps": write_bps
+        }
+
+
+def register_services_stream(sio):
+    """Register the per-service sampler on /graph-services"""
+    hub = get_metric_hub()
+    hub.register_collector("services", ServiceProcessCollector(), interval=2, history_key="services",
+                           isolated=True)
+    sampler = MetricSampler(sio, NAMESPACE, hub.collector("services", NAMESPACE), interval=2,
+                            history_keys=("services",))
+    sampler.register()
+    return sampler
@@ -0,0 +1,151 @@
+"""Compact, delta-encoded metrics frames for opted-in clients.
+
+The default metrics_update payload repeats every field name, an ISO datetime
+and full-precision floats on every tick. Clients that subscribe with
+"encoding": "compact" (JSON arrays) or "msgpack" (binary) instead receive:
+
+- metrics_schema, once and whenever the layout changes:
+    {"version", "encoding", "fields", "scales", "static", "keyframe_every"}
+- metrics_frame, every tick:
+    [version, seq, is_keyframe, t, v1, v2, ...]
+
+Numeric values are quantised to integers (value * scale). Keyframes carry the
+absolute timestamp in milliseconds and absolute values; other frames carry
+the difference from the previous frame, so clients rebuild values by
+summing. Strings and flags go into the schema's "static" map and trigger a
+new schema when they change. One level of nested dicts (as in /graph-all
+frames) is flattened to "cpu.cpu_usage" style names; lists are JSON-only.
+"""
+from typing import Any, Dict, List, Optional, Set
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, compact JSON arrays work without it
+    msgpack = None
+
+ENCODING_JSON = "json"
+ENCODING_COMPACT = "compact"
+ENCODING_MSGPACK = "msgpack"
+
+# Force an absolute frame periodically so a dropped packet heals quickly
+KEYFRAME_EVERY = 30
+
+# Floats keep two decimals, integers are sent as-is
+FLOAT_SCALE = 100
+
+
+def resolve_encoding(requested: Any) -> str:
+    """Map a client's requested encoding to one this server supports"""
+    if requested == ENCODING_MSGPACK:
+        return ENCODING_MSGPACK if msgpack is not None else ENCODING_COMPACT
+    if requested == ENCODING_COMPACT:
+        return ENCODING_COMPACT
+    return ENCODING_JSON
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_static(value: Any) -> bool:
+    return value is None or isinstance(value, (str, bool))
+
+
+def _flatten(payload: Dict[str, Any]) -> Dict[str, Any]:
+    flat: Dict[str, Any] = {}
+    for key, value in payload.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flat[f"{key}.{sub_key}"] = sub_value
+        else:
+            flat[key] = value
+    return flat
+
+
+class CompactEncoder:
+    """Encodes one subscriber group's stream into schema + delta frames"""
+
+    def __init__(self, encoding: str, keyframe_every: int = KEYFRAME_EVERY):
+        self.encoding = encoding
+        self.keyframe_every = keyframe_every
+        self.version = 0
+        self.fields: List[str] = []
+        self.scales: List[int] = []
+        self.static: Dict[str, Any] = {}
+        self.seq = 0
+        self.last_sent = 0.0
+        self.force_keyframe = True
+        # Members that still need the current schema
+        self.pending_schema: Set[str] = set()
+        self._prev_t = 0
+        self._prev_values: List[int] = []
+
+    def add_member(self, sid: str) -> None:
+        """A new member needs the schema and an absolute frame"""
+        self.pending_schema.add(sid)
+        self.force_keyframe = True
+
+    def schema(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "encoding": self.encoding,
+            "fields": self.fields,
+            "scales": self.scales,
+            "static": self.static,
+            "keyframe_every": self.keyframe_every
+        }
+
+    def _update_layout(self, payload: Dict[str, Any]) -> bool:
+        """Rebuild the schema if fields or static values changed"""
+        fields = [k for k, v in payload.items() if k not in ("timestamp", "datetime") and _is_number(v)]
+        static = {k: v for k, v in payload.items() if k != "datetime" and _is_static(v)}
+        if fields == self.fields and static == self.static:
+            return False
+
+        if fields != self.fields:
+            self.scales = [1 if isinstance(payload[k], int) else FLOAT_SCALE for k in fields]
+            self.fields = fields
+        self.static = static
+        self.version += 1
+        self.force_keyframe = True
+        return True
+
+    def encode(self, payload: Dict[str, Any]) -> Optional[Any]:
+        """Encode a metrics_update payload into a frame
+
+        Returns the frame (a list, or bytes for msgpack). Check
+        take_schema_recipients() afterwards for members needing the schema.
+        """
+        payload = _flatten(payload)
+        if self._update_layout(payload):
+            self.pending_schema = {"*"}
+
+        t = int(round(float(payload.get("timestamp", 0)) * 1000))
+        values = [int(round(float(payload[k]) * s)) for k, s in zip(self.fields, self.scales)]
+
+        keyframe = self.force_keyframe or self.seq % self.keyframe_every == 0
+        if keyframe:
+            frame = [self.version, self.seq, 1, t, *values]
+            self.force_keyframe = False
+        else:
+            frame = [self.version, self.seq, 0, t - self._prev_t,
+                     *[v - p for v, p in zip(values, self._prev_values)]]
+
+        self._prev_t = t
+        self._prev_values = values
+        self.seq += 1
+
+        if self.encoding == ENCODING_MSGPACK:
+            return msgpack.packb(frame)
+        return frame
+
+    def take_schema_recipients(self, members: List[str]) -> List[str]:
+        """Members that must receive the schema before the next frame"""
+        if not self.pending_schema:
+            return []
+        if "*" in self.pending_schema:
+            recipients = list(members)
+        else:
+            recipients = [sid for sid in members if sid in self.pending_schema]
+        self.pending_schema = set()
+        return recipients
@@ -0,0 +1,378 @@
+"""Process-wide registry of metric collectors shared by every stream.
+
+Each /graph-* stream registers its collector here and reads through the hub
+instead of calling psutil/NVML itself. Collection happens on a dedicated
+daemon thread: it samples every collector that some stream currently wants,
+on that collector's own schedule, and publishes each result as an immutable
+MetricSnapshot. Publishing swaps in a new dict of snapshots, so readers on the
+event loop never take a lock and never block on /proc, sysfs or the GPU
+driver.
+
+Collectors on the shared thread run one after another, so they must be
+cheap and unable to hang (/proc and sysfs reads). Collectors that call into
+something that can stall - NVML, statvfs on a dead network mount, the
+supervisor RPC, a scan of every process - are registered with isolated=True
+and run on a worker thread of their own. While an isolated sample is still
+running its next ticks are skipped, so a hung source only makes its own
+snapshot older; a sample running longer than STALL_WARNING_SECONDS is
+logged.
+
+Collectors registered with min/max intervals are adaptive: the thread backs
+off towards max_interval while a series is flat and bursts towards
+min_interval when it starts changing. Flat samples are published with
+full=False so streams can send keep-alives instead of full frames; a full
+frame still goes out at least every FULL_FRAME_INTERVAL seconds.
+
+The thread is also the single place that writes samples to metrics history.
+Once start_recording() has been called (from the app lifespan), every
+collector with a history_key is sampled at its history interval whether or
+not any stream is connected, so history is complete and written exactly once
+per sample; streams are just readers of the same snapshots. History runs on
+its own fixed schedule next to the adaptive stream rate: a history entry is
+due every history_interval, and a stream sample taken at that point serves
+both. Recorded collectors are therefore sampled at least every
+history_interval however flat the series is; for them the back-off only
+thins what streams emit (keep-alives instead of full frames), while history
+keeps every sample so short spikes are not lost.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend.services.env.metrics_history import log_metric
+
+logger = logging.getLogger(__name__)
+
+# Stateful collectors are reset after missing this many intervals
+RESET_AFTER_INTERVALS = 3
+
+# A stream's demand lapses if it has not read for this many of its intervals
+DEMAND_EXPIRY_INTERVALS = 2
+
+# Relative change (against max(|previous|, 1)) that counts as "changing"
+CHANGE_THRESHOLD = 0.01
+
+# Adaptive period multipliers while flat / changing
+BACKOFF_FACTOR = 1.5
+BURST_FACTOR = 0.5
+
+# Longest a flat series goes without a full frame, in seconds
+FULL_FRAME_INTERVAL = 30.0
+
+# An isolated collector still running after this long is logged as stalled
+STALL_WARNING_SECONDS = 10.0
+
+# Seconds a sample may fall before its history entry is due and still count
+HISTORY_SLACK = 0.05
+
+# Latest published reading of one collector. The metrics dict is shared with
+# every reader and must never be mutated after publishing. `interval` is the
+# effective sampling period and `full` is False for a flat (keep-alive) sample.
+MetricSnapshot = namedtuple("MetricSnapshot", ["name", "timestamp", "metrics", "seq", "interval", "full"])
+
+
+def significant_change(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> bool:
+    """Whether any top-level numeric field moved by more than CHANGE_THRESHOLD"""
+    if previous is None:
+        return True
+    for key, value in current.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        before = previous.get(key)
+        if not isinstance(before, (int, float)):
+            return True
+        if abs(value - before) > max(abs(before), 1.0) * CHANGE_THRESHOLD:
+            return True
+    return False
+
+
+class CollectorSpec:
+    """A registered collector plus its scheduling state"""
+
+    __slots__ = ("name", "collect", "interval", "history_key", "history_interval",
+                 "min_interval", "max_interval", "adaptive_period", "last_period",
+                 "last_sampled", "last_logged", "last_full", "last_metrics", "seq", "demand", "recorded",
+                 "isolated", "running_since", "stall_logged")
+
+    def __init__(self, name: str, collect: Callable[[], Any], interval: float,
+                 history_key: Optional[str], history_interval: Optional[float],
+                 min_interval: Optional[float] = None, max_interval: Optional[float] = None,
+                 isolated: bool = False):
+        self.name = name
+        self.collect = collect
+        self.interval = interval
+        self.history_key = history_key
+        self.history_interval = history_interval if history_interval is not None else interval
+        self.min_interval = min_interval if min_interval is not None else interval
+        self.max_interval = max_interval if max_interval is not None else interval
+        self.adaptive_period = interval
+        self.last_period = interval
+        self.last_sampled = 0.0
+        self.last_logged = 0.0
+        self.last_full = 0.0
+        self.last_metrics: Optional[Dict[str, Any]] = None
+        self.seq = 0
+        # consumer -> (interval it reads at, monotonic time of last read)
+        self.demand: Dict[str, tuple] = {}
+        # Sampled for history even without readers
+        self.recorded = False
+        # Runs on its own worker thread; monotonic start of the sample in flight
+        self.isolated = isolated
+        self.running_since: Optional[float] = None
+        self.stall_logged = False
+
+    @property
+    def adaptive(self) -> bool:
+        return self.min_interval < self.max_interval
+
+    def period(self, now: float) -> Optional[float]:
+        """Sampling period needed by current stream readers, or None if unread"""
+        active = [interval for interval, seen in self.demand.values()
+                  if now - seen < interval * DEMAND_EXPIRY_INTERVALS + 1]
+        if not active:
+            return None
+        if self.adaptive:
+            return self.adaptive_period
+        return max(self.interval, min(active))
+
+    def history_due(self, now: float) -> bool:
+        return now >= self.last_logged + self.history_interval - HISTORY_SLACK
+
+    def schedule(self, now: float) -> Tuple[Optional[float], Optional[float]]:
+        """(monotonic time the next sample is due, its period), or (None, None) if unwanted
+
+        Stream readers and history recording are scheduled independently;
+        whichever is due first sets the time.
+        """
+        period = self.period(now)
+        due = None if period is None else self.last_sampled + period
+        if self.recorded:
+            # A sample that returned nothing is retried at the fastest rate, not at once
+            logged = max(self.last_logged + self.history_interval, self.last_sampled + self.min_interval)
+            if due is None or logged < due:
+                due = logged
+            if period is None:
+                period = self.history_interval
+        return due, period
+
+
+class MetricHub:
+    """Samples registered collectors off the event loop and serves snapshots"""
+
+    def __init__(self):
+        self.collectors: Dict[str, CollectorSpec] = {}
+        self._snapshots: Dict[str, MetricSnapshot] = {}
+        self._demand_lock = threading.Lock()
+        # Serialises snapshot swaps from the collector thread and isolated workers
+        self._publish_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.recording = False
+
+    def register_collector(
+        self,
+        name: str,
+        collect: Callable[[], Any],
+        interval: float,
+        history_key: Optional[str] = None,
+        history_interval: Optional[float] = None,
+        min_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+        isolated: bool = False,
+    ) -> None:
+        """Register (or replace) the collector for a metric type
+
+        Args:
+            collect: Blocking callable returning the metrics dict for one
+                tick, or None to skip the tick. Runs on the collector
+                thread, or on its own worker when isolated.
+            interval: Base sampling interval in seconds
+            history_key: metrics_history type to record samples under
+            history_interval: Minimum seconds between history entries
+            min_interval: Fastest adaptive interval while the series changes
+            max_interval: Slowest adaptive interval while the series is flat
+            isolated: Run on a worker thread of its own, for collectors
+                whose calls can block (drivers, mounts, RPC)
+        """
+        spec = CollectorSpec(name, collect, interval, history_key, history_interval,
+                             min_interval, max_interval, isolated)
+        spec.recorded = self.recording and history_key is not None
+        self.collectors[name] = spec
+        if spec.recorded:
+            # Streams may register after recording started; schedule it now
+            self._wake.set()
+
+    # --- collector thread ----------------------------------------------
+
+    def start(self) -> None:
+        """Start the collector thread if it is not already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-collector", daemon=True)
+        self._thread.start()
+        logger.info("Metrics collector thread started")
+
+    def start_recording(self) -> None:
+        """Sample every history-backed collector at its history interval from now on
+
+        Called once from the app lifespan so metrics history does not depend
+        on a dashboard being open.
+        """
+        with self._demand_lock:
+            self.recording = True
+            for spec in self.collectors.values():
+                spec.recorded = spec.history_key is not None
+        recorded = [spec.name for spec in self.collectors.values() if spec.recorded]
+        logger.info(f"Recording metrics history for: {', '.join(recorded)}")
+        self.start()
+        self._wake.set()
+
+    def stop(self) -> None:
+        """Stop the collector thread; snapshots stay readable"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _sample(self, spec: CollectorSpec, now: float, period: float) -> None:
+        # Counter-delta collectors must not compute a rate across an idle gap
+        reset = getattr(spec.collect, "reset", None)
+        if callable(reset) and now - spec.last_sampled > spec.last_period * RESET_AFTER_INTERVALS:
+            reset()
+
+        timestamp = time.time()
+        try:
+            metrics = spec.collect()
+        except Exception as e:
+            logger.error(f"Error collecting {spec.name} metrics: {str(e)}")
+            metrics = None
+        spec.last_sampled = now
+        spec.last_period = period
+
+        if metrics is None:
+            return
+
+        changed = significant_change(spec.last_metrics, metrics)
+        spec.last_metrics = metrics
+        if spec.adaptive:
+            factor = BURST_FACTOR if changed else BACKOFF_FACTOR
+            spec.adaptive_period = min(spec.max_interval, max(spec.min_interval, spec.adaptive_period * factor))
+
+        full = changed or not spec.adaptive or now - spec.last_full >= FULL_FRAME_INTERVAL
+        if full:
+            spec.last_full = now
+        spec.seq += 1
+
+        # Copy-on-write swap: readers see either the old or the new dict
+        snapshot = MetricSnapshot(spec.name, timestamp, metrics, spec.seq, period, full)
+        with self._publish_lock:
+            self._snapshots = {**self._snapshots, spec.name: snapshot}
+
+        if spec.history_key and spec.history_due(now):
+            spec.last_logged = now
+            log_metric(spec.history_key, metrics, timestamp)
+
+    def _sample_isolated(self, spec: CollectorSpec, now: float, period: float) -> None:
+        try:
+            self._sample(spec, now, period)
+        finally:
+            if spec.stall_logged:
+                logger.info(f"{spec.name} collector recovered after {time.monotonic() - now:.1f}s")
+            spec.running_since = None
+            spec.stall_logged = False
+            self._wake.set()  # Schedule its next tick
+
+    def _start_isolated(self, spec: CollectorSpec, now: float, period: float) -> None:
+        spec.running_since = now
+        worker = threading.Thread(target=self._sample_isolated, args=(spec, now, period),
+                                  name=f"metrics-{spec.name}", daemon=True)
+        worker.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Clear before planning so a wake-up during the pass is not lost
+            self._wake.clear()
+            now = time.monotonic()
+            next_due = None
+            for spec in list(self.collectors.values()):
+                if spec.running_since is not None:
+                    # The worker wakes this thread when the sample finishes
+                    if now - spec.running_since >= STALL_WARNING_SECONDS and not spec.stall_logged:
+                        spec.stall_logged = True
+                        logger.warning(f"{spec.name} collector has not returned for "
+                                       f"{now - spec.running_since:.0f}s; skipping its ticks")
+                    continue
+                with self._demand_lock:
+                    due, period = spec.schedule(now)
+                if due is None:
+                    continue
+                if now >= due:
+                    if spec.isolated:
+                        self._start_isolated(spec, now, period)
+                        due = now + STALL_WARNING_SECONDS
+                    else:
+                        self._sample(spec, now, period)
+                        with self._demand_lock:
+                            due, _ = spec.schedule(now)
+                if due is not None:
+                    next_due = due if next_due is None else min(next_due, due)
+
+            timeout = None if next_due is None else max(0.01, next_due - time.monotonic())
+            self._wake.wait(timeout)
+
+    # --- readers (event loop) ------------------------------------------
+
+    def snapshot(self, name: str) -> Optional[MetricSnapshot]:
+        """Latest published snapshot for a collector, without registering demand"""
+        return self._snapshots.get(name)
+
+    def latest(self, name: str, consumer: str = "default", interval: Optional[float] = None) -> Optional[MetricSnapshot]:
+        """Latest snapshot for a collector; never blocks
+
+        Also records that `consumer` reads this collector every `interval`
+        seconds so the thread keeps sampling it at that rate. Returns None
+        until the first snapshot has been published.
+        """
+        spec = self.collectors.get(name)
+        if spec is None:
+            return None
+
+        now = time.monotonic()
+        interval = spec.interval if interval is None else interval
+        with self._demand_lock:
+            previous = spec.demand.get(consumer)
+            spec.demand[consumer] = (interval, now)
+        if (previous is None or previous[0] != interval
+                or now - previous[1] >= previous[0] * DEMAND_EXPIRY_INTERVALS + 1):
+            # New, faster or returning reader: re-plan the schedule now
+            self.start()
+            self._wake.set()
+
+        return self._snapshots.get(name)
+
+    def sample(self, name: str, consumer: str = "default", interval: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Latest metrics for a collector; see latest()"""
+        snapshot = self.latest(name, consumer, interval)
+        return snapshot.metrics if snapshot is not None else None
+
+    def collector(self, name: str, consumer: str) -> Callable[[float], Any]:
+        """Adapter that lets a MetricSampler read one collector via the hub"""
+        def collect(interval: float):
+            return self.latest(name, consumer, interval)
+        return collect
+
+
+_hub: Optional[MetricHub] = None
+
+
+def get_metric_hub() -> MetricHub:
+    """Return the process-wide metric hub"""
+    global _hub
+    if _hub is None:
+        _hub = MetricHub()
+    return _hub
@@ -0,0 +1,476 @@
+"""Shared per-metric samplers that broadcast to a Socket.IO room.
+
+Each /graph-* namespace owns exactly one MetricSampler. The sampler reads its
+collector (normally through the shared MetricHub) once per tick and emits the result to a room holding every
+connected client, so the sampling cost stays the same no matter how many
+dashboards are open. The polling task starts when the first client joins and
+is cancelled when the last one leaves.
+
+Clients may send a "subscribe" message naming the fields and interval they
+need, or asking to pause. Those clients leave the broadcast room and are
+served individually: the sampler ticks at the fastest interval any client
+needs and decimates the stream for slower ones. Clients that never subscribe
+keep the default payload (every field, or the sampler's default_fields) at
+the sampler's base interval. Subscribing
+with "encoding": "compact" or "msgpack" switches a client to the schema +
+delta frames described in metric_encoding.
+
+When the collector is read through the MetricHub, frames are tagged with
+the effective sampling "interval". Flat samples from adaptive collectors are
+sent as a small metrics_keepalive {"timestamp", "interval"} instead of a full
+frame, and while a collector bursts the default room follows its faster rate.
+
+A ClientFramer can rewrite each metrics_update per recipient, e.g. to send
+every client a delta against the frame it last received; JSON clients in
+the same state still share one packet.
+
+Samplers backed by metrics history fill reconnect gaps: a client that
+connects with its last-seen timestamp (Socket.IO auth {"since": ts} or
+?since=ts) first receives one metrics_backfill per history type, built by
+backfill_metric_history, then the hub's latest snapshot if history has not
+caught up with it yet, and only then joins the live stream.
+"""
+import asyncio
+import inspect
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qs
+
+from socketio import AsyncServer
+
+from backend.services.env.metrics_history import backfill_metric_history
+from backend.sockets.env.metric_encoding import ENCODING_JSON, CompactEncoder, resolve_encoding
+from backend.sockets.env.metric_hub import MetricSnapshot
+
+logger = logging.getLogger(__name__)
+
+# A collector is called with the sampler's current tick interval and returns
+# the metrics for one tick, or None to skip the tick. It must not block;
+# MetricHub adapters just read the latest snapshot. An awaitable is accepted.
+MetricCollector = Callable[[float], Any]
+
+# Slowest interval a client may request, in seconds
+MAX_INTERVAL = 60.0
+
+# Keys every client receives regardless of its field subscription
+ALWAYS_SENT = ("timestamp", "datetime", "interval", "intervals")
+
+# Seconds to wait before re-reading when the hub has not published yet
+RETRY_DELAY = 0.1
+
+
+def build_payload(timestamp: float, metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap collected metrics in the standard metrics_update payload"""
+    return {
+        "timestamp": float(timestamp),
+        "datetime": datetime.fromtimestamp(timestamp).isoformat(),
+        **metrics
+    }
+
+
+def parse_since(environ: Dict[str, Any], auth: Any) -> Optional[float]:
+    """Last-seen timestamp a reconnecting client sent, in seconds, if any"""
+    value = auth.get("since") if isinstance(auth, dict) else None
+    if value is None:
+        value = (parse_qs(environ.get("QUERY_STRING", "")).get("since") or [None])[0]
+    try:
+        since = float(value)
+    except (TypeError, ValueError):
+        return None
+    # Browsers naturally send Date.now() milliseconds
+    return since / 1000.0 if since > 1e11 else since
+
+
+def filter_payload(payload: Dict[str, Any], fields: Optional[FrozenSet[str]]) -> Dict[str, Any]:
+    """Keep only the requested fields, always retaining the timestamps"""
+    if fields is None:
+        return payload
+    return {
+        key: value for key, value in payload.items()
+        if key in fields or key in ALWAYS_SENT
+    }
+
+
+class ClientFramer:
+    """Turns one metrics_update payload into per-client frames
+
+    The default passes the payload through unchanged. Subclasses keep
+    per-client state (e.g. what each client last received) and group
+    clients that can share a frame.
+    """
+
+    def frames(self, sids: List[str], payload: Dict[str, Any]) -> List[Tuple[List[str], Dict[str, Any]]]:
+        """(recipients, payload) pairs covering every sid in `sids`"""
+        return [(sids, payload)]
+
+    def discard(self, sid: str) -> None:
+        """Forget a client that disconnected"""
+
+
+class Subscription:
+    """Fields, rate and pause state negotiated by one client"""
+
+    __slots__ = ("fields", "interval", "paused", "encoding", "last_sent")
+
+    def __init__(self, fields: Optional[FrozenSet[str]], interval: float, paused: bool,
+                 encoding: str = ENCODING_JSON):
+        self.fields = fields
+        self.interval = interval
+        self.paused = paused
+        self.encoding = encoding
+        self.last_sent = 0.0
+
+    @property
+    def encoder_key(self) -> Tuple[Optional[FrozenSet[str]], float, str]:
+        """Clients sharing this key share one delta stream"""
+        return (self.fields, self.interval, self.encoding)
+
+
+class MetricSampler:
+    """Samples one metric type and broadcasts it to every subscriber"""
+
+    def __init__(
+        self,
+        sio: AsyncServer,
+        namespace: str,
+        collect: MetricCollector,
+        interval: float,
+        min_interval: Optional[float] = None,
+        history_keys: Sequence[str] = (),
+        default_fields: Optional[Sequence[str]] = None,
+        framer: Optional[ClientFramer] = None,
+    ):
+        """
+        Args:
+            history_keys: metrics_history types replayed to clients that
+                reconnect with a last-seen timestamp
+            default_fields: Fields sent to clients that do not name any;
+                None sends every field
+            framer: Rewrites JSON metrics_update frames per client
+        """
+        self.sio = sio
+        self.namespace = namespace
+        self.room = f"{namespace}/subscribers"
+        self.collect = collect
+        self.interval = interval
+        self.min_interval = min_interval if min_interval is not None else interval
+        self.history_keys = tuple(history_keys)
+        self.default_fields = frozenset(default_fields) if default_fields is not None else None
+        self.framer = framer
+        self.subscribers: Set[str] = set()
+        self.subscriptions: Dict[str, Subscription] = {}
+        self._encoders: Dict[Tuple[Optional[FrozenSet[str]], float, str], CompactEncoder] = {}
+        self._task: Optional[asyncio.Future] = None
+        self._wake = asyncio.Event()
+        self._room_last_sent = 0.0
+        self._last_seq = -1
+        self._sample_interval: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def subscribe(self, sid: str) -> None:
+        """Add a client to the broadcast room, starting the sampler if needed"""
+        await self.sio.enter_room(sid, self.room, namespace=self.namespace)
+        self.subscribers.add(sid)
+        if not self.running:
+            logger.info(f"Starting {self.namespace} sampler")
+            self._task = self.sio.start_background_task(self._run)
+
+    async def unsubscribe(self, sid: str) -> None:
+        """Remove a client, stopping the sampler once nobody is listening"""
+        self.subscribers.discard(sid)
+        self.subscriptions.pop(sid, None)
+        if self.framer is not None:
+            self.framer.discard(sid)
+        try:
+            await self.sio.leave_room(sid, self.room, namespace=self.namespace)
+        except Exception:
+            pass  # The client is already gone from the room on disconnect
+        if not self.subscribers and self._task is not None:
+            logger.info(f"Stopping {self.namespace} sampler")
+            self._task.cancel()
+            self._task = None
+
+    async def set_subscription(self, sid: str, request: Any) -> Dict[str, Any]:
+        """Apply a client's subscribe message and return the effective terms
+
+        Args:
+            request: {"fields": [...], "interval": seconds, "paused": bool,
+                "encoding": "json" | "compact" | "msgpack"}; every key is
+                optional. {"reset": true} returns the client to
+                the default broadcast.
+        """
+        if sid not in self.subscribers:
+            return {"error": "Not connected"}
+        if not isinstance(request, dict):
+            request = {}
+
+        if request.get("reset"):
+            if self.subscriptions.pop(sid, None) is not None:
+                await self.sio.enter_room(sid, self.room, namespace=self.namespace)
+            self._wake.set()
+            fields = sorted(self.default_fields) if self.default_fields is not None else None
+            return {"fields": fields, "interval": self.interval, "paused": False, "encoding": ENCODING_JSON}
+
+        fields = request.get("fields")
+        if isinstance(fields, (list, tuple)) and fields:
+            fields = frozenset(str(f) for f in fields)
+        else:
+            fields = self.default_fields
+
+        try:
+            interval = float(request.get("interval", self.interval))
+        except (TypeError, ValueError):
+            interval = self.interval
+        interval = min(max(interval, self.min_interval), MAX_INTERVAL)
+
+        encoding = resolve_encoding(request.get("encoding"))
+        subscription = Subscription(fields, interval, bool(request.get("paused", False)), encoding)
+        if encoding != ENCODING_JSON:
+            encoder = self._encoders.get(subscription.encoder_key)
+            if encoder is None:
+                encoder = self._encoders[subscription.encoder_key] = CompactEncoder(encoding)
+            encoder.add_member(sid)
+
+        if sid not in self.subscriptions:
+            await self.sio.leave_room(sid, self.room, namespace=self.namespace)
+        self.subscriptions[sid] = subscription
+
+        # Re-evaluate the tick rate right away so a faster client is served promptly
+        self._wake.set()
+        return {
+            "fields": sorted(fields) if fields is not None else None,
+            "interval": interval,
+            "paused": subscription.paused,
+            "encoding": encoding
+        }
+
+    def requested_fields(self) -> Optional[Set[str]]:
+        """Union of fields active clients asked for; None if any wants everything"""
+        fields: Set[str] = set()
+        for sid in self.subscribers:
+            sub = self.subscriptions.get(sid)
+            if sub is not None and sub.paused:
+                continue
+            wanted = sub.fields if sub is not None else self.default_fields
+            if wanted is None:
+                return None
+            fields.update(wanted)
+        return fields
+
+    def _room_members(self) -> bool:
+        return len(self.subscribers) > len(self.subscriptions)
+
+    def _room_interval(self) -> float:
+        """Default clients follow an adaptive collector's burst rate"""
+        if self._sample_interval is not None:
+            return min(self.interval, self._sample_interval)
+        return self.interval
+
+    def _tick_interval(self) -> Optional[float]:
+        """Fastest interval any active client needs, or None if all are paused"""
+        intervals = [sub.interval for sub in self.subscriptions.values() if not sub.paused]
+        if self._room_members():
+            intervals.append(self._room_interval())
+        return min(intervals) if intervals else None
+
+    async def _emit_update(self, payload: Dict[str, Any], sids: Optional[List[str]] = None) -> None:
+        """Emit metrics_update to `sids`, or to the broadcast room if None"""
+        if self.framer is None:
+            await self.sio.emit("metrics_update", payload, to=self.room if sids is None else sids,
+                                namespace=self.namespace)
+            return
+        if sids is None:
+            sids = [sid for sid in self.subscribers if sid not in self.subscriptions]
+        for recipients, frame in self.framer.frames(sids, payload):
+            await self.sio.emit("metrics_update", frame, to=recipients, namespace=self.namespace)
+
+    async def _dispatch_keepalive(self, timestamp: float, tick_interval: float) -> None:
+        """Tell JSON clients the series is flat without resending it"""
+        beat = {"timestamp": float(timestamp), "interval": self._sample_interval}
+        now = time.monotonic()
+        slack = tick_interval / 2
+
+        if self._room_members() and now - self._room_last_sent >= self._room_interval() - slack:
+            self._room_last_sent = now
+            await self.sio.emit("metrics_keepalive", beat, to=self.room, namespace=self.namespace)
+
+        sids = []
+        for sid, sub in self.subscriptions.items():
+            if sub.encoding != ENCODING_JSON or sub.paused or now - sub.last_sent < sub.interval - slack:
+                continue
+            sub.last_sent = now
+            sids.append(sid)
+        if sids:
+            await self.sio.emit("metrics_keepalive", beat, to=sids, namespace=self.namespace)
+
+    async def _dispatch(self, timestamp: float, metrics: Dict[str, Any], tick_interval: float) -> None:
+        """Emit the sample to the room and to every individually due client"""
+        payload = build_payload(timestamp, metrics)
+        if self._sample_interval is not None:
+            payload["interval"] = self._sample_interval
+        now = time.monotonic()
+        # Tolerate scheduling jitter so a 10s client is not pushed to 11s
+        slack = tick_interval / 2
+
+        if self._room_members() and now - self._room_last_sent >= self._room_interval() - slack:
+            self._room_last_sent = now
+            await self._emit_update(filter_payload(payload, self.default_fields))
+
+        # Clients asking for the same fields share one encoded packet
+        groups: Dict[Optional[FrozenSet[str]], List[str]] = {}
+        encoded_members: Dict[Tuple[Optional[FrozenSet[str]], float, str], List[str]] = {}
+        for sid, sub in self.subscriptions.items():
+            if sub.encoding != ENCODING_JSON:
+                encoded_members.setdefault(sub.encoder_key, [])
+                if not sub.paused:
+                    encoded_members[sub.encoder_key].append(sid)
+                continue
+            if sub.paused or now - sub.last_sent < sub.interval - slack:
+                continue
+            sub.last_sent = now
+            groups.setdefault(sub.fields, []).append(sid)
+
+        for fields, sids in groups.items():
+            await self._emit_update(filter_payload(payload, fields), sids)
+
+        # Compact clients share a delta stream per (fields, interval, encoding)
+        for key in list(self._encoders):
+            if key not in encoded_members:
+                del self._encoders[key]
+
+        for key, sids in encoded_members.items():
+            encoder = self._encoders[key]
+            fields, interval, _ = key
+            if not sids or now - encoder.last_sent < interval - slack:
+                continue
+            encoder.last_sent = now
+
+            frame = encoder.encode(filter_payload(payload, fields))
+            schema_sids = encoder.take_schema_recipients(sids)
+            if schema_sids:
+                await self.sio.emit("metrics_schema", encoder.schema(), to=schema_sids, namespace=self.namespace)
+            await self.sio.emit("metrics_frame", frame, to=sids, namespace=self.namespace)
+
+    async def _run(self) -> None:
+        retried = False
+        try:
+            while self.subscribers:
+                tick_interval = self._tick_interval()
+                if tick_interval is None:
+                    # Every client is paused; sleep until one changes its subscription
+                    self._wake.clear()
+                    await self._wake.wait()
+                    continue
+
+                timestamp = time.time()
+                try:
+                    metrics = self.collect(tick_interval)
+                    if inspect.isawaitable(metrics):
+                        metrics = await metrics
+                except Exception as e:
+                    logger.error(f"Error collecting {self.namespace} metrics: {str(e)}")
+                    metrics = None
+
+                keepalive = False
+                if isinstance(metrics, MetricSnapshot):
+                    if metrics.seq == self._last_seq:
+                        if not retried:
+                            # The hub is about to publish; re-read once shortly
+                            # instead of skipping a sample
+                            retried = True
+                            await asyncio.sleep(min(RETRY_DELAY, tick_interval / 4))
+                            continue
+                        metrics = None  # Backed off: nothing new this tick
+                    else:
+                        self._last_seq = metrics.seq
+                        self._sample_interval = metrics.interval
+                        timestamp, keepalive, metrics = metrics.timestamp, not metrics.full, metrics.metrics
+
+                if metrics is not None:
+                    try:
+                        if keepalive:
+                            await self._dispatch_keepalive(timestamp, tick_interval)
+                        else:
+                            await self._dispatch(timestamp, metrics, tick_interval)
+                    except Exception as e:
+                        # Keep serving; a failed frame must not end the sampler
+                        logger.error(f"Error sending {self.namespace} metrics: {str(e)}")
+
+                retried = False
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), tick_interval)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            pass  # Last subscriber left, stop sampling
+        except Exception as e:
+            logger.error(f"Error in {self.namespace} sampler: {str(e)}")
+
+    async def send_latest(self, sid: str, after: Optional[float] = None) -> None:
+        """Emit the collector's latest hub snapshot to one client, if newer than `after`"""
+        try:
+            snapshot = self.collect(self.interval)
+            if inspect.isawaitable(snapshot):
+                snapshot = await snapshot
+        except Exception as e:
+            logger.error(f"Error reading {self.namespace} metrics: {str(e)}")
+            return
+        # Only hub snapshots carry the timestamp of the reading
+        if not isinstance(snapshot, MetricSnapshot) or (after is not None and snapshot.timestamp <= after):
+            return
+        payload = build_payload(snapshot.timestamp, snapshot.metrics)
+        payload["interval"] = snapshot.interval
+        await self._emit_update(filter_payload(payload, self.default_fields), [sid])
+
+    async def send_backfill(self, sid: str, since: float) -> None:
+        """Emit history newer than `since` to one client, one frame per type
+
+        History lags the live stream by up to a history interval, so the
+        latest snapshot follows when it is newer than the backfilled points.
+        """
+        newest = since
+        for key in self.history_keys:
+            try:
+                backfill = await asyncio.to_thread(backfill_metric_history, key, since)
+            except Exception as e:
+                logger.error(f"Error building {key} backfill for {self.namespace}: {e}")
+                continue
+            if backfill is not None:
+                await self.sio.emit("metrics_backfill", backfill, to=sid, namespace=self.namespace)
+                newest = max(newest, backfill["timestamps"][-1])
+        await self.send_latest(sid, newest)
+
+    def register(self, on_connect: Optional[Callable[[str], Any]] = None, send_latest: bool = False) -> None:
+        """Register connect/disconnect handlers that manage room membership
+
+        Args:
+            on_connect: Optional coroutine called with the sid before the
+                client joins the room, e.g. to send an initial frame
+            send_latest: Send every new client the latest snapshot instead
+                of leaving it to wait for the next tick
+        """
+        @self.sio.on("connect", namespace=self.namespace)
+        async def sampler_connect(sid, environ, auth=None):  # pylint: disable=unused-variable
+            since = parse_since(environ, auth) if self.history_keys else None
+            if since is not None:
+                # Before joining the room, so the gap is filled ahead of live frames
+                await self.send_backfill(sid, since)
+            elif send_latest:
+                await self.send_latest(sid)
+            if on_connect is not None:
+                await on_connect(sid)
+            await self.subscribe(sid)
+
+        @self.sio.on("disconnect", namespace=self.namespace)
+        async def sampler_disconnect(sid):  # pylint: disable=unused-variable
+            await self.unsubscribe(sid)
+
+        @self.sio.on("subscribe", namespace=self.namespace)
+        async def sampler_subscribe(sid, data=None):  # pylint: disable=unused-variable
+            return await self.set_subscription(sid, data)
@@ -0,0 +1,339 @@
+"""Prometheus / OpenMetrics rendering of the latest collector snapshots.
+
+The body is built from the MetricHub snapshots (never by sampling) and cached
+together with the sequence numbers of the snapshots it was built from. A
+scrape only rebuilds the text when some collector has published a new sample
+since, so any number of scrapers cost at most one render per sample tick.
+
+Collectors recorded to history are sampled continuously anyway. The others
+(per-core, per-device, per-interface) are only sampled while someone reads
+them, so a scrape registers itself as a reader every SCRAPE_INTERVAL; they
+appear from the scrape after the first one. Snapshots older than
+STALE_INTERVALS sampling periods are left out rather than exported as
+current values.
+
+Log error counts come from the indexed ServiceError table and are refreshed
+at most every ERROR_COUNT_REFRESH seconds.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from backend.db.models import ServiceError
+from backend.db.session import engine
+from backend.sockets.env.metric_hub import MetricHub, get_metric_hub
+
+logger = logging.getLogger(__name__)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+PREFIX = "vaio"
+
+# Seconds between ServiceError count queries
+ERROR_COUNT_REFRESH = 60
+
+# Collectors rendered when they have a fresh snapshot
+COLLECTORS = ("cpu", "cpu_cores", "memory", "disk", "network", "gpu", "services", "pressure", "disk_devices", "network_interfaces")
+
+# Sampling rate scrapes ask for on collectors that are not recorded
+SCRAPE_INTERVAL = 30
+
+# A snapshot older than this many of its sampling periods is not exported
+STALE_INTERVALS = 3
+
+MB = 1024 * 1024
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _Family:
+    """One metric family: TYPE/HELP header plus labelled samples"""
+
+    __slots__ = ("name", "kind", "help", "samples")
+
+    def __init__(self, name: str, kind: str, help_text: str):
+        self.name = f"{PREFIX}_{name}"
+        self.kind = kind
+        self.help = help_text
+        self.samples: List[Tuple[Dict[str, Any], Any]] = []
+
+    def add(self, value: Any, **labels) -> None:
+        if value is None:
+            return
+        self.samples.append((labels, value))
+
+    def render(self, lines: List[str], openmetrics: bool) -> None:
+        if not self.samples:
+            return
+        # OpenMetrics names counter families without the _total suffix
+        family = self.name if openmetrics or self.kind != "counter" else f"{self.name}_total"
+        sample_name = f"{self.name}_total" if self.kind == "counter" else self.name
+        lines.append(f"# HELP {family} {self.help}")
+        lines.append(f"# TYPE {family} {self.kind}")
+        for labels, value in self.samples:
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+
+
+def _column_families(metrics: Dict[str, Any], label: str, names_key: str,
+                     specs: Tuple[Tuple[str, str, str, float], ...]) -> List[_Family]:
+    """Families for a column-packed per-device payload
+
+    specs: (payload key, metric name, help, scale) per column.
+    """
+    names = metrics.get(names_key) or []
+    families = []
+    for key, name, help_text, scale in specs:
+        family = _Family(name, "gauge", help_text)
+        for device, value in zip(names, metrics.get(key) or []):
+            if value is not None:
+                family.add(value * scale if scale != 1 else value, **{label: device})
+        families.append(family)
+    return families
+
+
+def build_families(snapshots: Dict[str, Any], error_counts: Dict[str, int]) -> List[_Family]:
+    """Metric families for a set of snapshots keyed by collector name"""
+    families: List[_Family] = []
+
+    sampled = _Family("collector_sample_timestamp_seconds", "gauge", "Unix time of the latest sample per collector")
+    for name, snapshot in snapshots.items():
+        sampled.add(snapshot.timestamp, collector=name)
+    families.append(sampled)
+
+    cpu = snapshots.get("cpu")
+    if cpu is not None:
+        m = cpu.metrics
+        usage = _Family("cpu_usage_percent", "gauge", "Host CPU utilisation")
+        usage.add(m.get("cpu_usage"))
+        cores = _Family("cpu_logical_cores", "gauge", "Logical CPU cores")
+        cores.add(m.get("cpu_cores"))
+        temperature = _Family("cpu_temperature_celsius", "gauge", "Hottest CPU package temperature")
+        temperature.add(m.get("cpu_temperature"))
+        power = _Family("cpu_power_watts", "gauge", "CPU package power from RAPL")
+        power.add(m.get("cpu_power_watts"))
+        families += [usage, cores, temperature, power]
+
+    cpu_cores = snapshots.get("cpu_cores")
+    if cpu_cores is not None:
+        m = cpu_cores.metrics
+        core_usage = _Family("cpu_core_usage_percent", "gauge", "Per-core CPU utilisation")
+        for core, value in enumerate(m.get("usage") or []):
+            core_usage.add(value, core=core)
+        mode = _Family("cpu_mode_percent", "gauge", "Share of host CPU time per mode")
+        for name, value in (m.get("host") or {}).items():
+            if name != "usage":
+                mode.add(value, mode=name)
+        families += [core_usage, mode]
+
+    memory = snapshots.get("memory")
+    if memory is not None:
+        m = memory.metrics
+        for key, name, help_text in (
+            ("memory_total", "memory_total_bytes", "Total physical memory"),
+            ("memory_used", "memory_used_bytes", "Used physical memory"),
+            ("memory_percent", "memory_usage_percent", "Physical memory utilisation"),
+            ("swap_total", "swap_total_bytes", "Total swap"),
+            ("swap_used", "swap_used_bytes", "Used swap"),
+        ):
+            family = _Family(name, "gauge", help_text)
+            family.add(m.get(key))
+            families.append(family)
+
+    disk = snapshots.get("disk")
+    if disk is not None:
+        m = disk.metrics
+        for key, name, kind, help_text in (
+            ("disk_total", "disk_total_bytes", "gauge", "Root filesystem size"),
+            ("disk_used", "disk_used_bytes", "gauge", "Root filesystem used space"),
+            ("disk_percent", "disk_usage_percent", "gauge", "Root filesystem utilisation"),
+            ("read_bytes", "disk_read_bytes", "counter", "Bytes read from all disks"),
+            ("write_bytes", "disk_written_bytes", "counter", "Bytes written to all disks"),
+            ("read_count", "disk_reads_completed", "counter", "Reads completed on all disks"),
+            ("write_count", "disk_writes_completed", "counter", "Writes completed on all disks"),
+        ):
+            family = _Family(name, kind, help_text)
+            family.add(m.get(key))
+            families.append(family)
+
+    network = snapshots.get("network")
+    if network is not None:
+        m = network.metrics
+        tx = _Family("network_transmit_bytes_per_second", "gauge", "Host network transmit rate")
+        tx.add(m.get("tx_bytes"))
+        rx = _Family("network_receive_bytes_per_second", "gauge", "Host network receive rate")
+        rx.add(m.get("rx_bytes"))
+        families += [tx, rx]
+
+    gpu = snapshots.get("gpu")
+    if gpu is not None:
+        devices = gpu.metrics.get("devices") or []
+        count = _Family("gpu_count", "gauge", "NVIDIA GPUs visible through NVML")
+        count.add(len(devices))
+        families.append(count)
+        for key, name, help_text, scale in (
+            ("gpu_usage", "gpu_utilization_percent", "GPU core utilisation", 1),
+            ("gpu_mem", "gpu_memory_utilization_percent", "GPU memory utilisation", 1),
+            ("gpu_mem_used", "gpu_memory_used_bytes", "GPU memory used", MB),
+            ("gpu_mem_total", "gpu_memory_total_bytes", "GPU memory size", MB),
+            ("gpu_temp", "gpu_temperature_celsius", "GPU core temperature", 1),
+        ):
+            family = _Family(name, "gauge", help_text)
+            for device in devices:
+                value = device.get(key)
+                if value is not None:
+                    family.add(value * scale, gpu=device.get("index"), name=device.get("name"))
+            families.append(family)
+
+    services = snapshots.get("services")
+    if services is not None:
+        m = services.metrics
+        names = m.get("services") or []
+        up = _Family("service_up", "gauge", "1 if the supervisor program is RUNNING")
+        state = _Family("service_state", "gauge", "Supervisor program state (value is always 1)")
+        for name, value in zip(names, m.get("state") or []):
+            up.add(1 if value == "RUNNING" else 0, service=name)
+            state.add(1, service=name, state=value)
+        families += [up, state]
+        families += _column_families(m, "service", "services", (
+            ("cpu_percent", "service_cpu_percent", "CPU used by the service's process tree", 1),
+            ("rss", "service_memory_rss_bytes", "Resident memory of the service's process tree", 1),
+            ("processes", "service_processes", "Processes in the service's tree", 1),
+        ))
+
+    pressure = snapshots.get("pressure")
+    if pressure is not None:
+        m = pressure.metrics
+        stalled = _Family("pressure_stalled_percent", "gauge", "PSI share of time tasks stalled on a resource")
+        for resource in ("cpu", "memory", "io"):
+            for kind in ("some", "full"):
+                for window in ("avg10", "avg60", "avg300"):
+                    stalled.add(m.get(f"{resource}_{kind}_{window}"), resource=resource, kind=kind, window=window)
+        families.append(stalled)
+        families += _column_families(m, "service", "services", (
+            ("cpu_throttled_percent", "service_cgroup_cpu_throttled_percent", "CPU time the service's cgroup was throttled", 1),
+            ("memory_current", "service_cgroup_memory_bytes", "Memory charged to the service's cgroup", 1),
+            ("memory_max", "service_cgroup_memory_limit_bytes", "memory.max of the service's cgroup", 1),
+            ("memory_pressure", "service_cgroup_memory_pressure_percent", "Memory PSI some avg10 of the service's cgroup", 1),
+        ))
+
+    disk_devices = snapshots.get("disk_devices")
+    if disk_devices is not None:
+        families += _column_families(disk_devices.metrics, "device", "devices", (
+            ("read_bps", "disk_device_read_bytes_per_second", "Per-device read rate", 1),
+            ("write_bps", "disk_device_write_bytes_per_second", "Per-device write rate", 1),
+            ("util_percent", "disk_device_utilization_percent", "Per-device busy time", 1),
+        ))
+
+    interfaces = snapshots.get("network_interfaces")
+    if interfaces is not None:
+        families += _column_families(interfaces.metrics, "interface", "interfaces", (
+            ("tx_bps", "network_interface_transmit_bytes_per_second", "Per-interface transmit rate", 1),
+            ("rx_bps", "network_interface_receive_bytes_per_second", "Per-interface receive rate", 1),
+        ))
+
+    errors = _Family("log_errors", "gauge", "Indexed error lines per service log")
+    for service, count in sorted(error_counts.items()):
+        errors.add(count, service=service)
+    families.append(errors)
+    return families
+
+
+def render(families: List[_Family], openmetrics: bool = True) -> str:
+    lines: List[str] = []
+    for family in families:
+        family.render(lines, openmetrics)
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExposition:
+    """Cached exposition body, rebuilt only when a snapshot changed"""
+
+    def __init__(self, hub: Optional[MetricHub] = None):
+        self.hub = hub or get_metric_hub()
+        self._lock = threading.Lock()
+        self._key: Optional[tuple] = None
+        self._bodies: Dict[bool, str] = {}
+        self._error_counts: Dict[str, int] = {}
+        self._errors_read = 0.0
+
+    def _refresh_error_counts(self) -> None:
+        """Re-count errors when due; the query runs outside the lock"""
+        with self._lock:
+            now = time.monotonic()
+            if self._errors_read and now - self._errors_read < ERROR_COUNT_REFRESH:
+                return
+            # Claimed up front so concurrent scrapes keep serving the old counts
+            self._errors_read = now
+        try:
+            with Session(engine) as session:
+                rows = session.exec(select(ServiceError.service, func.count()).group_by(ServiceError.service)).all()
+        except Exception as e:
+            logger.warning(f"Could not count service errors for /metrics: {e}")
+            return
+        with self._lock:
+            self._error_counts = {service: count for service, count in rows}
+
+    def _snapshots(self) -> Dict[str, Any]:
+        """Fresh snapshots of every exported collector, keyed by name"""
+        now = time.time()
+        snapshots = {}
+        for name in COLLECTORS:
+            spec = self.hub.collectors.get(name)
+            if spec is None:
+                continue
+            if spec.recorded:
+                snapshot = self.hub.snapshot(name)
+            else:
+                # Keeps the collector sampled between scrapes
+                snapshot = self.hub.latest(name, "openmetrics", SCRAPE_INTERVAL)
+            if snapshot is not None and now - snapshot.timestamp <= snapshot.interval * STALE_INTERVALS:
+                snapshots[name] = snapshot
+        return snapshots
+
+    def body(self, openmetrics: bool = True) -> str:
+        """Exposition text in OpenMetrics or Prometheus 0.0.4 format"""
+        self._refresh_error_counts()
+        with self._lock:
+            snapshots = self._snapshots()
+            key = (tuple((name, snapshot.seq) for name, snapshot in snapshots.items()),
+                   tuple(sorted(self._error_counts.items())))
+            if key != self._key:
+                self._key = key
+                self._bodies = {}
+            body = self._bodies.get(openmetrics)
+            if body is None:
+                body = render(build_families(snapshots, self._error_counts), openmetrics)
+                self._bodies[openmetrics] = body
+            return body
+
+
+_exposition: Optional[MetricsExposition] = None
+
+
+def get_metrics_exposition() -> MetricsExposition:
+    """Return the process-wide exposition cache"""
+    global _exposition
+    if _exposition is None:
+        _exposition = MetricsExposition()
+    return _exposition
@@ -17,11 +17,18 @@ from backend.sockets.utils.pty_handler import register_pty_handlers
 
 # Updated per-service metric streams (modular)
 from backend.sockets.env.graph_cpu_stream import register_cpu_stream
+from backend.sockets.env.graph_cpu_cores_stream import register_cpu_cores_stream
 # Import statements for other socket streams
 from backend.sockets.env.graph_gpu_stream import register_gpu_stream
 from backend.sockets.env.graph_memory_stream import register_memory_stream
 from backend.sockets.env.graph_disk_stream import register_disk_stream
 from backend.sockets.env.graph_network_stream import register_network_stream
+from backend.sockets.env.graph_disk_devices_stream import register_disk_devices_stream
+from backend.sockets.env.graph_network_interfaces_stream import register_network_interfaces_stream
+from backend.sockets.env.graph_services_stream import register_services_stream
+from backend.sockets.env.graph_pressure_stream import register_pressure_stream
+from backend.sockets.env.graph_processes_stream import register_processes_stream
+from backend.sockets.env.graph_all_stream import register_all_stream
 
 
 logger = logging.getLogger(__name__)
@@ -79,10 +86,18 @@ def register_sio_handlers(sio: AsyncServer):
             stream_handlers = [
                 # Active metric stream handlers
                 (register_cpu_stream, "CPU monitoring (/graph-cpu)"),
+                (register_cpu_cores_stream, "Per-core CPU monitoring (/graph-cpu-cores)"),
                 (register_gpu_stream, "GPU monitoring (/graph-gpu)"),
                 (register_memory_stream, "Memory monitoring (/graph-memory)"),
                 (register_network_stream, "Network monitoring (/graph-network)"),
-                (register_disk_stream, "Disk monitoring (/graph-disk)")
+                (register_disk_stream, "Disk monitoring (/graph-disk)"),
+                (register_disk_devices_stream, "Per-device disk monitoring (/graph-disk-devices)"),
+                (register_network_interfaces_stream, "Per-interface network monitoring (/graph-network-interfaces)"),
+                (register_services_stream, "Per-service resource monitoring (/graph-services)"),
+                (register_pressure_stream, "Resource pressure monitoring (/graph-pressure)"),
+                (register_processes_stream, "Top-N process tables (/graph-processes)"),
+                # Multiplexed stream reads the collectors registered above
+                (register_all_stream, "Combined monitoring (/graph-all)")
             ]
             
             for handler, name in stream_handlers:
@@ -0,0 +1,108 @@
+"""HostSensors against a temporary sysfs tree"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services.env import host_sensors
+from backend.services.env.host_sensors import HostSensors
+
+ENERGY = "class/powercap/intel-rapl:0/energy_uj"
+SUBZONE_ENERGY = "class/powercap/intel-rapl:0:0/energy_uj"
+
+
+def write(root, path, value):
+    path = os.path.join(str(root), path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f"{value}\n")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls time.monotonic() as seen by host_sensors"""
+    now = [1000.0]
+    monkeypatch.setattr(host_sensors, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def add_rapl(root, energy, wrap=None):
+    write(root, "class/powercap/intel-rapl:0/name", "package-0")
+    write(root, ENERGY, energy)
+    if wrap is not None:
+        write(root, "class/powercap/intel-rapl:0/max_energy_range_uj", wrap)
+    # Subzones are not packages and must not be summed
+    write(root, "class/powercap/intel-rapl:0:0/name", "core")
+    write(root, SUBZONE_ENERGY, 0)
+
+
+def test_hottest_labelled_package_temperature(tmp_path):
+    write(tmp_path, "class/hwmon/hwmon0/name", "coretemp")
+    write(tmp_path, "class/hwmon/hwmon0/temp1_label", "Package id 0")
+    write(tmp_path, "class/hwmon/hwmon0/temp1_input", 48000)
+    write(tmp_path, "class/hwmon/hwmon0/temp2_label", "Core 0")
+    write(tmp_path, "class/hwmon/hwmon0/temp2_input", 90000)
+    write(tmp_path, "class/hwmon/hwmon0/temp3_label", "Package id 1")
+    write(tmp_path, "class/hwmon/hwmon0/temp3_input", 52500)
+    write(tmp_path, "class/hwmon/hwmon1/name", "nvme")
+    write(tmp_path, "class/hwmon/hwmon1/temp1_input", 70000)
+
+    sensors = HostSensors(str(tmp_path))
+
+    assert sensors.read() == {"cpu_temperature": 52.5}
+    # Handles stay open: a changed value is read without rediscovery
+    write(tmp_path, "class/hwmon/hwmon0/temp1_input", 61000)
+    assert sensors.read() == {"cpu_temperature": 61.0}
+    sensors.close()
+
+
+def test_thermal_zone_fallback(tmp_path):
+    write(tmp_path, "class/thermal/thermal_zone0/type", "acpitz")
+    write(tmp_path, "class/thermal/thermal_zone0/temp", 30000)
+    write(tmp_path, "class/thermal/thermal_zone1/type", "x86_pkg_temp")
+    write(tmp_path, "class/thermal/thermal_zone1/temp", 45000)
+
+    sensors = HostSensors(str(tmp_path))
+
+    assert sensors.read() == {"cpu_temperature": 45.0}
+    sensors.close()
+
+
+def test_rapl_power_from_energy_delta(tmp_path, clock):
+    add_rapl(tmp_path, 1_000_000, wrap=100_000_000)
+    sensors = HostSensors(str(tmp_path))
+    assert sensors.read() == {}  # The first reading only primes the counter
+
+    clock[0] += 2
+    write(tmp_path, ENERGY, 21_000_000)
+    write(tmp_path, SUBZONE_ENERGY, 50_000_000)
+
+    assert sensors.read() == {"cpu_power_watts": 10.0}
+    sensors.close()
+
+
+def test_rapl_counter_wrap(tmp_path, clock):
+    add_rapl(tmp_path, 9_000_000, wrap=10_000_000)
+    sensors = HostSensors(str(tmp_path))
+    sensors.read()
+
+    clock[0] += 2
+    write(tmp_path, ENERGY, 3_000_000)
+
+    assert sensors.read() == {"cpu_power_watts": 2.0}
+    sensors.close()
+
+
+def test_rapl_wrap_with_unknown_range_skips_sample(tmp_path, clock):
+    add_rapl(tmp_path, 9_000_000)
+    sensors = HostSensors(str(tmp_path))
+    sensors.read()
+
+    clock[0] += 2
+    write(tmp_path, ENERGY, 3_000_000)
+    assert sensors.read() == {}
+
+    clock[0] += 1
+    write(tmp_path, ENERGY, 5_000_000)
+    assert sensors.read() == {"cpu_power_watts": 2.0}
+    sensors.close()
@@ -0,0 +1,117 @@
+"""NvmlSession against a fake pynvml module"""
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services.env.nvml_session import NvmlSession
+
+MIB = 1024 * 1024
+
+
+class FakeNvml:
+    """The subset of pynvml NvmlSession calls, with call counters"""
+
+    NVML_TEMPERATURE_GPU = 0
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.init_calls = 0
+        self.shutdown_calls = 0
+        self.fail_init = False
+        self.fail_reads = False
+
+    def nvmlInit(self):
+        self.init_calls += 1
+        if self.fail_init:
+            raise RuntimeError("NVML_ERROR_DRIVER_NOT_LOADED")
+
+    def nvmlShutdown(self):
+        self.shutdown_calls += 1
+
+    def nvmlDeviceGetCount(self):
+        return len(self.devices)
+
+    def nvmlDeviceGetHandleByIndex(self, index):
+        return index
+
+    def nvmlDeviceGetName(self, handle):
+        return self.devices[handle]["name"]
+
+    def nvmlSystemGetDriverVersion(self):
+        return b"550.54.14"
+
+    def nvmlDeviceGetUtilizationRates(self, handle):
+        if self.fail_reads:
+            raise RuntimeError("NVML_ERROR_GPU_IS_LOST")
+        return SimpleNamespace(gpu=self.devices[handle]["gpu"])
+
+    def nvmlDeviceGetMemoryInfo(self, handle):
+        device = self.devices[handle]
+        return SimpleNamespace(used=device["used"], total=device["total"])
+
+    def nvmlDeviceGetTemperature(self, handle, sensor):
+        assert sensor == self.NVML_TEMPERATURE_GPU
+        return self.devices[handle]["temp"]
+
+
+@pytest.fixture
+def nvml():
+    return FakeNvml([
+        {"name": b"NVIDIA A100", "gpu": 40, "used": 1024 * MIB, "total": 4096 * MIB, "temp": 55},
+        {"name": "NVIDIA T4", "gpu": 0, "used": 0, "total": 0, "temp": 30},
+    ])
+
+
+def test_initialises_once_and_caches_devices(nvml):
+    session = NvmlSession(nvml)
+
+    assert session.device_names() == ["NVIDIA A100", "NVIDIA T4"]
+    assert session.driver_version() == "550.54.14"
+    session.sample()
+    session.sample()
+
+    assert nvml.init_calls == 1
+
+
+def test_sample_reads_every_device(nvml):
+    devices = NvmlSession(nvml).sample()
+
+    assert devices[0] == {
+        "index": 0, "name": "NVIDIA A100", "gpu_usage": 40, "gpu_mem": 25.0,
+        "gpu_mem_used": 1024, "gpu_mem_total": 4096, "gpu_temp": 55,
+    }
+    assert devices[1]["gpu_mem"] == 0
+    assert devices[1]["gpu_temp"] == 30
+
+
+def test_failed_init_backs_off(nvml):
+    nvml.fail_init = True
+    session = NvmlSession(nvml, retry_interval=3600)
+
+    assert session.sample() == []
+    assert not session.available
+    assert nvml.init_calls == 1
+
+
+def test_read_error_shuts_down_and_reinitialises(nvml):
+    session = NvmlSession(nvml, retry_interval=0)
+    session.sample()
+
+    nvml.fail_reads = True
+    assert session.sample() == []
+    assert nvml.shutdown_calls == 1
+
+    nvml.fail_reads = False
+    assert len(session.sample()) == 2
+    assert nvml.init_calls == 2
+
+
+def test_shutdown_releases_nvml(nvml):
+    session = NvmlSession(nvml)
+    session.sample()
+
+    session.shutdown()
+
+    assert nvml.shutdown_calls == 1
+    assert session.driver_version() == "550.54.14"
+    assert nvml.init_calls == 2